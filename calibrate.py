@@ -0,0 +1,232 @@
+#! /usr/bin/env python3
+"""
+Finds the fastest usable camera configuration on this board and camera.
+
+Each sensor mode is tried with video and preview configurations, and the
+plain still configuration used before, measuring the real capture frame
+rate and the cost of detecting motion on those frames. The best one is
+saved to a cache file that is used on later starts.
+
+Run this to calibrate again, for example after changing the camera:
+
+    python3 calibrate.py
+"""
+import json
+import logging
+import os
+import time
+from typing import Callable
+
+import cv2
+
+# pylint: disable=I1101
+# Module 'cv2' has no '...' member.
+
+logger = logging.getLogger("detector")
+
+# Size of the frames motion is detected on
+DETECT_SIZE = (640, 480)
+# Memory is [R, G, B], which the rest of the code expects
+DETECT_FORMAT = "BGR888"
+
+
+class ModeResult: # pylint: disable=R0903
+    """ Measurements of one camera configuration """
+    def __init__(self, mode: dict, capture_seconds: float, detect_seconds: float):
+        """
+        Args:
+            mode: Configuration, as returned by candidate_modes
+            capture_seconds: Time waiting in capture_array, per frame
+            detect_seconds: Time to detect motion in one frame
+        """
+        self.mode = mode
+        self.capture_seconds = capture_seconds
+        self.detect_seconds = detect_seconds
+
+    @property
+    def effective_fps(self) -> float:
+        """
+        Frames per second that can be captured and checked for motion. The
+        camera queues frames while motion is detected, which shortens the
+        wait in the next capture, so the two times are added, not compared.
+        """
+        loop_seconds = self.capture_seconds + self.detect_seconds
+        return 1.0 / loop_seconds if loop_seconds > 0 else 0.0
+
+    def __repr__(self):
+        return (f"{describe(self.mode)}: capture {self.capture_seconds * 1000:.1f}ms, "
+                f"detect {self.detect_seconds * 1000:.1f}ms, effective {self.effective_fps:.1f}fps")
+
+
+def describe(mode: dict) -> str:
+    """ Short description of a mode for logging """
+    sensor = mode.get("sensor")
+    if sensor is None:
+        return mode["configuration"]
+    size = sensor["output_size"]
+    return f"{mode['configuration']} {size[0]}x{size[1]} {sensor['bit_depth']}bit"
+
+
+def candidate_modes(sensor_modes: list) -> list[dict]:
+    """
+    Get the configurations to try: video and preview configurations for each
+    sensor mode, and the still configuration with the default sensor mode.
+    """
+    ret = [{"configuration": "still", "sensor": None, "fps": None}]
+    for sensor_mode in sensor_modes:
+        sensor = {"output_size": list(sensor_mode["size"]),
+                  "bit_depth": sensor_mode["bit_depth"]}
+        for configuration in ("video", "preview"):
+            ret.append({"configuration": configuration, "sensor": sensor,
+                        "fps": sensor_mode.get("fps")})
+    return ret
+
+
+def choose_mode(results: list[ModeResult], min_fps: float = 1.0) -> ModeResult | None:
+    """
+    Choose the mode with the highest effective frame rate, then the cheapest
+    detection. Modes under min_fps are not usable.
+    """
+    usable = [result for result in results if result.effective_fps >= min_fps]
+    if not usable:
+        return None
+    return max(usable, key=lambda result: (round(result.effective_fps, 1),
+                                           -result.detect_seconds))
+
+
+def create_configuration(picam2, mode: dict):
+    """ Create the Picamera2 configuration for a mode """
+    create = getattr(picam2, f"create_{mode['configuration']}_configuration")
+    kwargs = {"main": {"size": DETECT_SIZE, "format": DETECT_FORMAT}}
+    if mode.get("sensor") is not None:
+        kwargs["sensor"] = {"output_size": tuple(mode["sensor"]["output_size"]),
+                            "bit_depth": mode["sensor"]["bit_depth"]}
+    if mode.get("fps"):
+        kwargs["controls"] = {"FrameRate": mode["fps"]}
+    return create(**kwargs)
+
+
+def detect_cost(prev_gray, frame):
+    """ Do the per-frame work of motion detection, returning the new gray frame """
+    gray = cv2.GaussianBlur(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (21, 21), 0)
+    if prev_gray is not None:
+        _, thresh = cv2.threshold(cv2.absdiff(prev_gray, gray), 25, 255, cv2.THRESH_BINARY)
+        thresh = cv2.dilate(thresh, None, iterations=2)
+        cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return gray
+
+
+def measure(picam2, mode: dict, frames: int = 30, warmup: int = 5,
+            timer: Callable[[], float] = time.perf_counter) -> ModeResult:
+    """
+    Measure one mode on a stopped camera, leaving it stopped.
+
+    Args:
+        picam2: Picamera2, or anything with the same configure, start,
+            stop, capture_array, and create_*_configuration methods
+        mode: Configuration to measure
+        frames: Frames to time
+        warmup: Frames captured before timing, while the camera settles
+        timer: Clock used for timing
+    """
+    picam2.configure(create_configuration(picam2, mode))
+    picam2.start()
+    try:
+        for _ in range(warmup):
+            picam2.capture_array()
+
+        capture_seconds = 0.0
+        detect_seconds = 0.0
+        prev_gray = None
+        for _ in range(frames):
+            started = timer()
+            frame = picam2.capture_array()
+            captured = timer()
+            prev_gray = detect_cost(prev_gray, frame)
+            capture_seconds += captured - started
+            detect_seconds += timer() - captured
+    finally:
+        picam2.stop()
+
+    return ModeResult(mode, capture_seconds / frames, detect_seconds / frames)
+
+
+def calibrate(picam2, frames: int = 30, min_fps: float = 1.0,
+              timer: Callable[[], float] = time.perf_counter) -> dict | None:
+    """
+    Measure all the candidate modes of a stopped camera and choose the best.
+
+    Returns:
+        The chosen mode, or None if none is usable
+    """
+    results = []
+    for mode in candidate_modes(picam2.sensor_modes):
+        try:
+            result = measure(picam2, mode, frames, timer=timer)
+        except Exception as e: # pylint: disable=C0103,W0718
+            logger.info("  %s: failed %s", describe(mode), e)
+            continue
+        logger.info("  %s", result)
+        results.append(result)
+
+    best = choose_mode(results, min_fps)
+    if best is None:
+        logger.error("No usable camera mode found")
+        return None
+    logger.info("Chose camera mode %s", best)
+    return best.mode
+
+
+def load_mode(path: str, model: str) -> dict | None:
+    """
+    Load the mode saved by calibration, if it was for this camera model
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as cache:
+            saved = json.load(cache)
+    except (OSError, ValueError) as e:
+        logger.warning("Can't read camera mode from %s: %s", path, e)
+        return None
+    if saved.get("camera_model") != model:
+        logger.info("Camera mode in %s is for %s, not %s", path,
+                    saved.get("camera_model"), model)
+        return None
+    return saved["mode"]
+
+
+def save_mode(path: str, model: str, mode: dict) -> None:
+    """ Save the mode chosen by calibration """
+    with open(path, "w", encoding="utf-8") as cache:
+        json.dump({"camera_model": model, "mode": mode}, cache, indent=2)
+
+
+def camera_model() -> str:
+    """ Get the model of the first camera, like imx500 """
+    import picamera2 # pylint: disable=C0415
+    cameras = picamera2.Picamera2.global_camera_info()
+    return cameras[0]["Model"] if cameras else "unknown"
+
+
+if __name__ == "__main__":
+    import configparser
+    from picamera2 import Picamera2
+
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+
+    motion_config = configparser.ConfigParser()
+    motion_config.read('motion.ini')
+    mode_file = motion_config.get('motion', 'camera_mode_file', fallback='camera_mode.json')
+
+    model_name = camera_model()
+    logger.info("Calibrating %s", model_name)
+    camera = Picamera2()
+    try:
+        chosen = calibrate(camera)
+    finally:
+        camera.close()
+    if chosen is not None:
+        save_mode(mode_file, model_name, chosen)
+        logger.info("Saved to %s", mode_file)
@@ -0,0 +1,195 @@
+"""
+Watchdog around the camera that restarts it, in process, when frames stall.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable
+
+logger = logging.getLogger("detector")
+
+
+class CaptureTimeout(Exception):
+    """ Raised when a camera call doesn't finish before its deadline """
+
+
+class _CaptureWorker: # pylint: disable=R0903
+    """
+    Daemon thread that makes the camera calls so the caller can stop waiting
+    on one that hangs. A worker with a hung call is abandoned and replaced.
+    If the hung call finishes after all, its result is given to the call's
+    cleanup, so a camera it opened isn't left holding the device.
+    """
+    def __init__(self):
+        self.requests = queue.SimpleQueue()
+        self.abandoned = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.abandoned:
+            func, done, result, cleanup = self.requests.get()
+            try:
+                value = func()
+            except Exception as e: # pylint: disable=C0103,W0718
+                value = e
+            with self.lock:
+                result.append(value)
+                done.set()
+                late = self.abandoned
+            if late and cleanup is not None and not isinstance(value, Exception):
+                try:
+                    cleanup(value)
+                except Exception as e: # pylint: disable=C0103,W0718
+                    logger.warning("Error cleaning up after a late camera call: %s", e)
+
+    def call(self, func: Callable[[], Any], timeout: float,
+             cleanup: Callable[[Any], None] | None = None):
+        """
+        Call func on the worker thread, waiting up to timeout seconds.
+
+        Args:
+            func: Camera call to make
+            timeout: Seconds to wait for it
+            cleanup: Called with func's result if it finishes after the timeout
+
+        Raises:
+            CaptureTimeout: if func didn't finish in time. The worker is then
+                abandoned and must not be used again.
+        """
+        done = threading.Event()
+        result = []
+        self.requests.put((func, done, result, cleanup))
+        if not done.wait(timeout):
+            with self.lock:
+                self.abandoned = not done.is_set()
+            if self.abandoned:
+                raise CaptureTimeout(f"Camera call didn't finish in {timeout}s")
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0]
+
+
+def _close(camera) -> None:
+    """ Stop and close a camera, closing it even if stopping fails """
+    try:
+        camera.stop()
+    finally:
+        if hasattr(camera, "close"):
+            camera.close()
+
+
+class CaptureWatchdog: # pylint: disable=R0902
+    """
+    Wraps a Picamera2, or anything with capture_array and stop, enforcing a
+    deadline on each capture. When a capture stalls or fails, the camera is
+    stopped and a new one opened, with backoff, then capturing resumes. The
+    caller just sees a slow capture_array call.
+    """
+    def __init__(self, open_camera: Callable[[], Any], # pylint: disable=R0913
+                 timeout_seconds: float = 5.0,
+                 backoff_seconds: float = 1.0,
+                 max_backoff_seconds: float = 60.0):
+        """
+        Args:
+            open_camera: Returns a new, started camera
+            timeout_seconds: Deadline for each capture
+            backoff_seconds: First wait between failed restarts, doubled each time
+            max_backoff_seconds: Longest wait between failed restarts
+        """
+        self.open_camera = open_camera
+        self.timeout_seconds = timeout_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+        # metrics
+        self.stalls = 0
+        self.restarts = 0
+        self.last_recovery_seconds = 0.0
+        self.total_recovery_seconds = 0.0
+
+        self._worker = _CaptureWorker()
+        self.camera = self._worker.call(open_camera, timeout_seconds, _close)
+
+    def capture_array(self, *args, **kwargs):
+        """ Capture a frame, restarting the camera as needed until one is captured """
+        while True:
+            started = time.monotonic()
+            try:
+                return self._worker.call(lambda: self.camera.capture_array(*args, **kwargs),
+                                         self.timeout_seconds)
+            except CaptureTimeout:
+                self.stalls += 1
+                logger.warning("Capture stalled for %.1fs, restarting the camera (stall %d)",
+                               self.timeout_seconds, self.stalls)
+            except Exception as e: # pylint: disable=C0103,W0718
+                self.stalls += 1
+                logger.warning("Capture failed, restarting the camera (stall %d): %s",
+                               self.stalls, e)
+            self.restart(started)
+
+    def restart(self, started: float | None = None) -> None:
+        """
+        Stop the camera and open a new one, retrying with backoff until it opens
+
+        Args:
+            started: time.monotonic() when the capture that failed started,
+                to count the time to recover from then. Now if not given.
+        """
+        if started is None:
+            started = time.monotonic()
+        self._close_camera()
+
+        backoff = self.backoff_seconds
+        while True:
+            try:
+                self.camera = self._worker.call(self.open_camera, self.timeout_seconds, _close)
+                break
+            except Exception as e: # pylint: disable=C0103,W0718
+                if self._worker.abandoned:
+                    self._worker = _CaptureWorker()
+                logger.warning("Camera restart failed, retrying in %.0fs: %s", backoff, e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff_seconds)
+
+        self.restarts += 1
+        self.last_recovery_seconds = time.monotonic() - started
+        self.total_recovery_seconds += self.last_recovery_seconds
+        logger.info("Camera restarted in %.1fs (%d stalls, %d restarts, %.1fs total recovery)",
+                    self.last_recovery_seconds, self.stalls, self.restarts,
+                    self.total_recovery_seconds)
+
+    def stop(self) -> None:
+        """ Stop the camera """
+        self._close_camera()
+
+    def stats(self) -> dict:
+        """ Get the watchdog metrics """
+        return {
+            "stalls": self.stalls,
+            "restarts": self.restarts,
+            "last_recovery_seconds": round(self.last_recovery_seconds, 3),
+            "total_recovery_seconds": round(self.total_recovery_seconds, 3),
+        }
+
+    def _close_camera(self) -> None:
+        """
+        Stop and close the camera. A worker stuck in a hung capture is replaced
+        first, and a hung stop is abandoned, since a new camera is opened anyway.
+        If the stop finishes later, the camera is still closed.
+        """
+        if self._worker.abandoned:
+            self._worker = _CaptureWorker()
+        camera = self.camera
+        if camera is None:
+            return
+        self.camera = None
+
+        try:
+            self._worker.call(lambda: _close(camera), self.timeout_seconds)
+        except Exception as e: # pylint: disable=C0103,W0718
+            logger.warning("Error stopping the camera: %s", e)
+            if self._worker.abandoned:
+                self._worker = _CaptureWorker()
@@ -0,0 +1,59 @@
+"""
+Time for the detector, so tests can run it on a virtual clock instead of
+waiting for real hours to pass.
+"""
+import time
+from time import struct_time
+
+
+class Clock:
+    """ Real time """
+    def time(self) -> float:
+        """ Seconds since the epoch, like time.time """
+        return time.time()
+
+    def localtime(self, seconds: float | None = None) -> struct_time:
+        """ Local time of seconds since the epoch, or now, like time.localtime """
+        return time.localtime(self.time() if seconds is None else seconds)
+
+    def sleep(self, seconds: float) -> None:
+        """ Wait, like time.sleep """
+        time.sleep(seconds)
+
+
+class SimulationFinished(Exception):
+    """ Raised when a VirtualClock passes its end """
+
+
+class VirtualClock(Clock):
+    """
+    Clock that only moves when told to, and jumps ahead instead of sleeping
+    """
+    def __init__(self, start: float, end: float | None = None):
+        """
+        Args:
+            start: Seconds since the epoch to start at
+            end: Seconds since the epoch to stop at, by raising SimulationFinished
+        """
+        self.now = start
+        self.start = start
+        self.end = end
+        self.slept = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept += max(seconds, 0.0)
+        self.advance(seconds)
+
+    def advance(self, seconds: float) -> None:
+        """
+        Move the clock forward
+
+        Raises:
+            SimulationFinished: if the clock is at or past its end
+        """
+        self.now += max(seconds, 0.0)
+        if self.end is not None and self.now >= self.end:
+            raise SimulationFinished()
@@ -3,14 +3,27 @@
 Motion detection using Raspberry Pi Camera Module and Picamera2.
 """
 import configparser
+import functools
 import logging
 import os
 import time
+from typing import Callable
 
 import cv2
-import picamera2
 
+import calibrate
+import clock
 import send_email
+import thermal
+from camera_watchdog import CaptureWatchdog
+from frame_bus import FramePublisher
+from heatmap import ActivityHeatmap, parse_zones
+from log_setup import IntervalSummary
+from memory_monitor import MemoryLimitExceeded, MemoryMonitor
+from pet_classifier import PetClassifier, parse_classes
+from preview_server import PreviewServer
+from span_trace import span, tracer
+from tracker import Tracker
 
 # pylint: disable=I1101
 # Module 'cv2' has no '...' member.
@@ -21,7 +34,7 @@ logger = logging.getLogger("detector")
 
 class MotionOptions: # pylint: disable=R0902,R0903
     """ This class is used to store the motion options """
-    def __init__(self, motion_config: dict):
+    def __init__(self, motion_config: dict): # pylint: disable=R0915
         if motion_config is None:
             return
 
@@ -34,7 +47,56 @@ class MotionOptions: # pylint: disable=R0902,R0903
         self.time_limit_minutes = motion_config.getint('time_limit_minutes', 2)
         self.max_hour = motion_config.getint('max_hour', 21)
         self.min_hour = motion_config.getint('min_hour', 8)
-        self.picam2 : picamera2.picamera2 = None
+        self.log_summary_seconds = motion_config.getfloat('log_summary_seconds', 5.0)
+        self.preview_port = motion_config.getint('preview_port', 0)
+        self.preview_max_fps = motion_config.getfloat('preview_max_fps', 5.0)
+        self.camera_mode_file = motion_config.get('camera_mode_file', 'camera_mode.json')
+        self.auto_calibrate = motion_config.getboolean('auto_calibrate', True)
+        self.capture_timeout_seconds = motion_config.getfloat('capture_timeout_seconds', 5.0)
+        self.restart_backoff_seconds = motion_config.getfloat('restart_backoff_seconds', 1.0)
+        self.restart_max_backoff_seconds = motion_config.getfloat('restart_max_backoff_seconds',
+                                                                  60.0)
+        self.heatmap_dir = motion_config.get('heatmap_dir', '')
+        self.heatmap_dtype = motion_config.get('heatmap_dtype', 'uint32')
+        self.heatmap_keep_days = motion_config.getint('heatmap_keep_days', 30)
+        self.exclude_zones = parse_zones(motion_config.get('exclude_zones', ''))
+        self.trace_spans = motion_config.getint('trace_spans', 0)
+        self.trace_file = motion_config.get('trace_file', 'trace-%Y%m%d-%H%M%S.json')
+        self.frame_bus_name = motion_config.get('frame_bus_name', '')
+        self.frame_bus_slots = motion_config.getint('frame_bus_slots', 4)
+        self.thermal_check_seconds = motion_config.getfloat('thermal_check_seconds', 10.0)
+        self.thermal_temp_path = motion_config.get('thermal_temp_path',
+                                                   '/sys/class/thermal/thermal_zone0/temp')
+        self.thermal_load_path = motion_config.get('thermal_load_path', '/proc/loadavg')
+        self.thermal_warm_temp = motion_config.getfloat('thermal_warm_temp', 70.0)
+        self.thermal_hot_temp = motion_config.getfloat('thermal_hot_temp', 78.0)
+        self.thermal_hysteresis = motion_config.getfloat('thermal_hysteresis', 5.0)
+        self.thermal_max_load = motion_config.getfloat('thermal_max_load', 0.0)
+        self.memory_check_seconds = motion_config.getfloat('memory_check_seconds', 0)
+        self.memory_trace = motion_config.getboolean('memory_trace', False)
+        self.memory_soft_limit_mb = motion_config.getint('memory_soft_limit_mb', 0)
+        self.memory_max_resets = motion_config.getint('memory_max_resets', 3)
+        self.track_confirm_frames = motion_config.getint('track_confirm_frames', 2)
+        self.track_max_missed = motion_config.getint('track_max_missed', 5)
+        self.track_merge_distance = motion_config.getint('track_merge_distance', 20)
+        self.classifier_kind = motion_config.get('classifier', 'off')
+        self.classifier_model = motion_config.get('classifier_model', '')
+        self.classifier_input_size = motion_config.getint('classifier_input_size', 224)
+        self.classifier_classes = motion_config.get('classifier_classes', '151-293')
+        self.classifier_min_confidence = motion_config.getfloat('classifier_min_confidence', 0.5)
+        self.classifier_cache_seconds = motion_config.getfloat('classifier_cache_seconds', 10.0)
+        self.classifier_timeout_seconds = motion_config.getfloat('classifier_timeout_seconds',
+                                                                 2.0)
+        self.classifier_load_timeout_seconds = motion_config.getfloat(
+            'classifier_load_timeout_seconds', 60.0)
+        self.clock = clock.Clock()
+        self.picam2 : CaptureWatchdog = None
+        self.classifier : PetClassifier | None = None
+        self.preview : PreviewServer | None = None
+        self.memory : MemoryMonitor | None = None
+        self.frame_bus : FramePublisher | None = None
+        self.thermal : thermal.ThermalGovernor | None = None
+        self.heatmap : ActivityHeatmap | None = None
 
     @staticmethod
     def get_motion_options():
@@ -49,7 +111,11 @@ class MotionOptions: # pylint: disable=R0902,R0903
             logger.error('Motion configuration not found in motion.ini')
             return None
 
-        ret = MotionOptions(motion)
+        try:
+            ret = MotionOptions(motion)
+        except ValueError as e: # pylint: disable=C0103
+            logger.error('Bad setting in motion.ini: %s', e)
+            return None
         logger.info('Motion settings:')
         logger.info('  Threshold      : %s', ret.threshold)
         logger.info('  Min Area       : %s', ret.min_area)
@@ -59,9 +125,78 @@ class MotionOptions: # pylint: disable=R0902,R0903
         logger.info('  Time Limit     : %dm', ret.time_limit_minutes)
         logger.info('  Min Hour       : %d', ret.min_hour)
         logger.info('  Max Hour       : %d', ret.max_hour)
+        logger.info('  Log Summary    : %ds', ret.log_summary_seconds)
+        logger.info('  Preview Port   : %s', ret.preview_port or 'off')
+        logger.info('  Preview FPS    : %.1f', ret.preview_max_fps)
+        logger.info('  Camera Mode    : %s', ret.camera_mode_file)
+        logger.info('  Auto Calibrate : %s', ret.auto_calibrate)
+        logger.info('  Capture Timeout: %.1fs', ret.capture_timeout_seconds)
+        logger.info('  Track Confirm  : %d frames', ret.track_confirm_frames)
+        logger.info('  Classifier     : %s %s', ret.classifier_kind, ret.classifier_model)
+        logger.info('  Classify Limit : %.1fs', ret.classifier_timeout_seconds)
+        logger.info('  Heatmap Dir    : %s', ret.heatmap_dir or 'off')
+        logger.info('  Heatmap Days   : %s', ret.heatmap_keep_days or 'all')
+        logger.info('  Exclude Zones  : %s', ret.exclude_zones or 'none')
+        logger.info('  Trace Spans    : %s', ret.trace_spans or 'off')
+        logger.info('  Frame Bus      : %s', ret.frame_bus_name or 'off')
+        logger.info('  Thermal Check  : %s', f'{ret.thermal_check_seconds:.0f}s'
+                    if ret.thermal_check_seconds else 'off')
+        logger.info('  Thermal Temps  : %.0f/%.0f C', ret.thermal_warm_temp, ret.thermal_hot_temp)
+        logger.info('  Memory Check   : %s', f'{ret.memory_check_seconds:.0f}s'
+                    if ret.memory_check_seconds else 'off')
+        logger.info('  Memory Trace   : %s', ret.memory_trace)
+        logger.info('  Memory Limit   : %s', f'{ret.memory_soft_limit_mb}MB'
+                    if ret.memory_soft_limit_mb else 'none')
+        logger.info('  Memory Resets  : %s', ret.memory_max_resets or 'no limit')
 
         return ret
 
+def open_camera(mode: dict | None = None):
+    """
+    Open, configure, and start the camera
+
+    Args:
+        mode: Camera mode chosen by calibration, None for the still configuration
+    """
+    # imported here so the detector can run without a camera, like in soak.py
+    import picamera2 # pylint: disable=C0415
+    picam2 = picamera2.Picamera2()
+    if mode is None:
+        motion_config = picam2.create_still_configuration(main={"size": calibrate.DETECT_SIZE})
+    else:
+        motion_config = calibrate.create_configuration(picam2, mode)
+    picam2.configure(motion_config)
+    picam2.start()
+    return picam2
+
+def camera_mode(options: MotionOptions) -> dict | None:
+    """
+    Get the camera mode saved by calibration for this camera model, calibrating
+    it first if there isn't one and auto_calibrate is on
+
+    Returns:
+        The mode, None for the still configuration
+    """
+    model = calibrate.camera_model()
+    mode = calibrate.load_mode(options.camera_mode_file, model)
+    if mode is not None or not options.auto_calibrate:
+        return mode
+
+    logger.info("Calibrating camera %s", model)
+    import picamera2 # pylint: disable=C0415
+    picam2 = picamera2.Picamera2()
+    try:
+        mode = calibrate.calibrate(picam2)
+    except Exception as e: # pylint: disable=C0103,W0718
+        logger.error("Calibration failed, using the still configuration: %s", e)
+        return None
+    finally:
+        picam2.close()
+    if mode is not None:
+        calibrate.save_mode(options.camera_mode_file, model, mode)
+        logger.info("Saved camera mode to %s", options.camera_mode_file)
+    return mode
+
 def setup() -> MotionOptions | None:
     """
     Setup the motion detection
@@ -72,25 +207,275 @@ def setup() -> MotionOptions | None:
     if options is None:
         return None
 
+    if options.trace_spans > 0:
+        tracer.configure(options.trace_spans, options.trace_file)
+
     # Create the directory to store images if it doesn't exist
     if not os.path.exists(options.image_save_dir):
         os.makedirs(options.image_save_dir)
 
-    # Initialize the camera
-    picam2 = picamera2.Picamera2()
-    motion_config = picam2.create_still_configuration(main={"size": (640, 480)})
-    picam2.configure(motion_config)
-    picam2.start()
-    options.picam2 = picam2
+    # Start the classifier process before the camera is opened, since that
+    # starts the fork server its workers are forked from
+    if options.classifier_kind != 'off':
+        options.classifier = PetClassifier(options.classifier_kind,
+                                           options.classifier_model,
+                                           options.classifier_input_size,
+                                           parse_classes(options.classifier_classes),
+                                           options.classifier_min_confidence,
+                                           options.classifier_cache_seconds,
+                                           options.classifier_timeout_seconds,
+                                           options.classifier_load_timeout_seconds)
+        options.classifier.start()
+
+    # Initialize the camera in the fastest mode, restarting it if captures stall
+    mode = camera_mode(options)
+    logger.info("Camera mode: %s", "still" if mode is None else calibrate.describe(mode))
+    options.picam2 = CaptureWatchdog(functools.partial(open_camera, mode),
+                                     options.capture_timeout_seconds,
+                                     options.restart_backoff_seconds,
+                                     options.restart_max_backoff_seconds)
+
+    if options.heatmap_dir:
+        options.heatmap = ActivityHeatmap(options.heatmap_dir, options.heatmap_dtype,
+                                          options.heatmap_keep_days)
+
+    if options.frame_bus_name:
+        options.frame_bus = FramePublisher(options.frame_bus_name, options.frame_bus_slots)
+
+    if options.thermal_check_seconds > 0:
+        options.thermal = thermal.ThermalGovernor(options.thermal_temp_path,
+                                                  options.thermal_load_path,
+                                                  options.thermal_warm_temp,
+                                                  options.thermal_hot_temp,
+                                                  options.thermal_hysteresis,
+                                                  options.thermal_max_load,
+                                                  options.thermal_check_seconds)
+
+    if options.memory_check_seconds > 0:
+        options.memory = MemoryMonitor(options.memory_check_seconds,
+                                       options.memory_soft_limit_mb,
+                                       options.memory_max_resets,
+                                       options.memory_trace)
+
+    if options.preview_port:
+        options.preview = PreviewServer(options.preview_port, options.preview_max_fps)
+        options.preview.status_providers["camera"] = options.picam2.stats
+        if options.memory is not None:
+            options.preview.status_providers["memory"] = options.memory.stats
+        if options.thermal is not None:
+            options.preview.status_providers["thermal"] = options.thermal.stats
+        options.preview.start()
 
     return options
 
+def prepare_gray(frame, scale: int = 1):
+    """
+    Get the blurred gray image motion is detected on, shrunk by scale
+    """
+    with span("color"):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if scale > 1:
+        with span("resize"):
+            gray = cv2.resize(gray, None, fx=1 / scale, fy=1 / scale,
+                              interpolation=cv2.INTER_AREA)
+    # keep the blur the same size relative to the scene
+    blur = max((21 // scale) | 1, 3)
+    with span("blur"):
+        return cv2.GaussianBlur(gray, (blur, blur), 0)
+
+def new_tracker(options: MotionOptions) -> Tracker:
+    """
+    Create the tracker that follows motion boxes across frames
+    """
+    return Tracker(options.track_confirm_frames, options.track_max_missed,
+                   merge_distance=options.track_merge_distance,
+                   recheck_seconds=options.classifier_cache_seconds)
+
+def write_jpeg(path: str, image) -> None:
+    """
+    Write an image as a JPEG, like cv2.imwrite, with encoding and writing traced separately
+    """
+    with span("encode"):
+        _, jpeg = cv2.imencode(".jpg", image)
+    with span("write"):
+        with open(path, "wb") as file:
+            file.write(jpeg)
+
+def throttle(options: MotionOptions) -> thermal.Level:
+    """
+    Get how much work to do for the next frame, sleeping first when the Pi is hot or busy
+    """
+    level = thermal.FULL if options.thermal is None else options.thermal.check()
+    if level.frame_interval_seconds:
+        with span("thermal sleep"):
+            options.clock.sleep(level.frame_interval_seconds)
+    return level
+
+def reset_detector(options: MotionOptions):
+    """
+    Drop the detector state and reopen the camera, to free memory
+
+    Returns:
+        (tracker, prev_gray) to start over with
+    """
+    tracker = new_tracker(options)
+    if options.classifier is not None:
+        options.classifier.reset()
+    options.picam2.restart()
+    options.memory.after_reset()
+    return tracker, prepare_gray(options.picam2.capture_array())
+
+def threshold_motion(options: MotionOptions, prev_gray, gray_frame, frame_shape: tuple,
+                     scale: int):
+    """
+    Get the difference between two gray frames, and where it is over the
+    threshold, outside the exclude zones
+
+    Returns:
+        (frame_delta, thresh) images
+    """
+    # Calculate the difference between frames
+    with span("diff"):
+        frame_delta = cv2.absdiff(prev_gray, gray_frame)
+
+    # Apply a binary threshold
+    with span("threshold"):
+        _, thresh = cv2.threshold(frame_delta, options.threshold, 255, cv2.THRESH_BINARY)
+
+    # Count where motion is, then ignore the areas that always have some
+    if options.heatmap is not None:
+        with span("heatmap"):
+            options.heatmap.add(thresh, frame_shape)
+    for (x, y, w, h) in options.exclude_zones: # pylint: disable=C0103
+        thresh[y // scale:(y + h) // scale, x // scale:(x + w) // scale] = 0
+
+    # Dilate the threshold image to fill in holes
+    with span("dilate"):
+        thresh = cv2.dilate(thresh, None, iterations=2)
+    return frame_delta, thresh
+
+def motion_boxes(options: MotionOptions, thresh, scale: int,
+                 contour_summary: IntervalSummary) -> list:
+    """
+    Get the (x, y, w, h) boxes, in the frame, of the areas of the threshold
+    image big enough to be motion
+    """
+    with span("contours"):
+        contours, _ = cv2.findContours(thresh.copy(),
+                                        cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    # Loop through contours and find the ones big enough to be motion
+    # per-contour logging is verrrry noisy, so it is summarized per interval
+    # areas are in the scaled down image, boxes are in the frame
+    min_area = options.min_area / (scale * scale)
+    boxes = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        contour_summary.add(area)
+        if area < min_area:
+            continue
+
+        # Get bounding box for the contour
+        boxes.append(tuple(value * scale for value in cv2.boundingRect(contour)))
+    return boxes
+
+def confirm_motion(options: MotionOptions, tracker: Tracker, frame, boxes: list) -> list:
+    """
+    Follow the boxes across frames, so each object fires once, when confirmed
+
+    Returns:
+        Tracks newly confirmed, and classified as an animal if there is a classifier
+    """
+    now = options.clock.time()
+    confirmed = tracker.update(boxes, now)
+
+    # Only the motion areas are classified, and only when there is motion.
+    # Tracks that aren't animals, like a curtain, are left for a while
+    if confirmed and options.classifier is not None:
+        with span("classify"):
+            is_animal = options.classifier.is_animal(frame, [track.box for track in confirmed])
+        if not is_animal:
+            logger.debug("Motion of %d tracks is not an animal", len(confirmed))
+            for track in confirmed:
+                track.rejected_at = now
+            return []
+    return confirmed
+
+def mark_motion(options: MotionOptions, tracker: Tracker, confirmed: list, frame) -> float:
+    """
+    Draw the boxes of the tracks in the frame, and write it out as the trigger image
+
+    Returns:
+        When the motion was detected
+    """
+    for track in tracker.tracks:
+        if track.missed == 0:
+            (x, y, w, h) = track.box # pylint: disable=C0103
+            # Draw rectangle around detected motion
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    for track in confirmed:
+        track.fired = True
+        (x, y, w, h) = track.box # pylint: disable=C0103
+        logger.debug("Motion detected at (%d, %d) with width %d and height %d, "
+                     "track %d confirmed after %.1fs, %d frames, moved %.0f pixels",
+                     x, y, w, h, track.track_id, track.duration, track.hits,
+                     track.distance)
+
+    # write out the current cv2 image, once for the event
+    motion_detected = options.clock.time()
+    with span("color"):
+        trigger = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    write_jpeg(os.path.join(options.image_save_dir, "motion_detected_cv2.jpg"), trigger)
+    return motion_detected
+
+def show_frames(options: MotionOptions, level: thermal.Level, frame, frame_delta, thresh):
+    """
+    Show the frame and the images motion was detected with, on the display
+    and the preview server, unless the Pi is too hot or busy
+    """
+    if not level.display:
+        return
+    if options.has_display:
+        with span("imshow"):
+            cv2.imshow("Frame Delta", frame_delta)
+            cv2.imshow("RGB Camera feed", cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            cv2.imshow("Threshold", thresh)
+            # if don't have this the preview window will show correctly or refresh
+            cv2.waitKey(1)
+    if options.preview is not None:
+        options.preview.publish("delta", frame_delta)
+        options.preview.publish("raw", frame, cv2.COLOR_BGR2RGB)
+        options.preview.publish("threshold", thresh)
+
+def capture_snapshot(options: MotionOptions, motion_detected: float) -> tuple[str, str]:
+    """
+    Capture the image to send, image_delay_seconds after the motion was detected
+
+    Returns:
+        (image path, trigger image path)
+    """
+    # the motion may be something barely entering the frame, so
+    # wait a bit, then capture the current image and write it out
+    logger.debug("Motion detected at %s, waiting %.1f sec",
+                 time.strftime("%I:%M:%S", options.clock.localtime(motion_detected)),
+                 options.image_delay_seconds)
+    with span("image delay"):
+        options.clock.sleep(max(motion_detected + options.image_delay_seconds -
+                                options.clock.time(), 0))
+    with span("capture"):
+        frame = options.picam2.capture_array()
+    with span("color"):
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    path = os.path.join(options.image_save_dir, "motion_detected.jpg")
+    write_jpeg(path, frame)
+    return path,os.path.join(options.image_save_dir, "motion_detected_cv2.jpg")
+
 # Threshold 200 doesn't work
 # 100 works, but slow motion is detected
 # 50 works, pretty well
 # 25 works
 # min_area up to 15000 works since that's the change area
-def detect_motion_ai_camera(options: MotionOptions) -> str | None: # pylint: disable=R0914
+def detect_motion_ai_camera(options: MotionOptions) -> tuple[str, str] | None:
     """
     Detect motion using Raspberry Pi Camera Module and Picamera2.
 
@@ -99,97 +484,70 @@ def detect_motion_ai_camera(options: MotionOptions) -> str | None: # pylint: dis
         min_area (int): Minimum contour area to qualify as motion.
     """
     # Capture the first frame
-    frame = options.picam2.capture_array()
-    prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    prev_gray = cv2.GaussianBlur(prev_gray, (21, 21), 0)
+    prev_gray = prepare_gray(options.picam2.capture_array())
 
     logger.info("Starting motion check.")
 
-    motion_detected = None
-    logged = False
+    tracker = new_tracker(options)
+    contour_summary = IntervalSummary("%d contours, max area %s in the last %.0fs",
+                                      options.log_summary_seconds)
 
     try:
         while True:
-            if ((motion_detected is not None) and
-                (time.time() - motion_detected > options.image_delay_seconds)):
-                # capture the current image and write it out
-                logger.debug("Motion detected at %s, and > %.1f sec has passed",
-                      motion_detected, options.image_delay_seconds)
-                frame = cv2.cvtColor(options.picam2.capture_array(), cv2.COLOR_BGR2RGB)
-                path = os.path.join(options.image_save_dir, "motion_detected.jpg")
-                cv2.imwrite(path, frame)
-                return path,os.path.join(options.image_save_dir, "motion_detected_cv2.jpg")
-
-            if motion_detected is not None:
-                if not logged:
-                    logger.debug("Motion detected at %s, but not in the last %d seconds.",
-                                 time.strftime("%I:%M",
-                                               time.localtime(motion_detected)),
-                                                options.image_delay_seconds)
-                    logged = True
+            if options.memory is not None and options.memory.check():
+                # drop the detector state and reopen the camera, then start over
+                del prev_gray
+                tracker, prev_gray = reset_detector(options)
                 continue
 
-            # Capture the next frame
-            frame = options.picam2.capture_array()
-
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray_frame = cv2.GaussianBlur(gray_frame, (21, 21), 0)
-
-            # Calculate the difference between frames
-            frame_delta = cv2.absdiff(prev_gray, gray_frame)
-
-            # Display the frame_delta for debugging
-            if options.has_display:
-                cv2.imshow("Frame Delta", frame_delta)
-
-            # Apply a binary threshold
-            _, thresh = cv2.threshold(frame_delta, options.threshold, 255, cv2.THRESH_BINARY)
-
-            # Dilate the threshold image to fill in holes
-            thresh = cv2.dilate(thresh, None, iterations=2)
+            # Do less work per frame when the Pi is hot or busy
+            level = throttle(options)
 
-            contours, _ = cv2.findContours(thresh.copy(),
-                                            cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-            # Loop through contours and detect motion
-            # logger.debug("Found %d contours", len(contours)) # verrrry noisy
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                logger.debug("Contour Area: %s min_area is %s", area, options.min_area)
-                if area < options.min_area:
-                    continue
+            # Capture the next frame
+            with span("capture"):
+                frame = options.picam2.capture_array()
+            if options.frame_bus is not None:
+                with span("frame bus"):
+                    options.frame_bus.publish(frame)
+
+            gray_frame = prepare_gray(frame, level.scale)
+            if gray_frame.shape != prev_gray.shape:
+                # the scale changed, so start over from this frame
+                prev_gray = gray_frame
+                continue
 
-                # Get bounding box for the contour
-                (x, y, w, h) = cv2.boundingRect(contour) # pylint: disable=C0103
-                # Draw rectangle around detected motion
-                logger.debug("Motion detected at (%d, %d) with width %d and height %d area %d",
-                             x, y, w, w, area)
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            frame_delta, thresh = threshold_motion(options, prev_gray, gray_frame,
+                                                   frame.shape[:2], level.scale)
+            boxes = motion_boxes(options, thresh, level.scale, contour_summary)
+            contour_summary.flush()
 
-                # write out the current cv2 image
-                motion_detected = time.time()
-                cv2.imwrite(os.path.join(options.image_save_dir, "motion_detected_cv2.jpg"),
-                            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            confirmed = confirm_motion(options, tracker, frame, boxes)
+            if confirmed:
+                motion_detected = mark_motion(options, tracker, confirmed, frame)
 
             # Display the frames
-            if options.has_display:
-                cv2.imshow("RGB Camera feed", cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                cv2.imshow("Threshold", thresh)
+            show_frames(options, level, frame, frame_delta, thresh)
 
-            # Update previous frame
-            prev_gray = gray_frame.copy()
+            if confirmed:
+                return capture_snapshot(options, motion_detected)
 
-            # if don't have this the preview window will show correctly or refresh
-            cv2.waitKey(1)
+            # Update previous frame
+            prev_gray = gray_frame
 
     except KeyboardInterrupt:
         logger.debug("Motion detection interrupted.")
         options.picam2.stop()
         cv2.destroyAllWindows()
+    except MemoryLimitExceeded as e: # pylint: disable=C0103
+        # resetting doesn't help, so exit and let the supervisor restart the process
+        logger.error("%s, exiting", e)
+        options.picam2.stop()
+        raise SystemExit(1) from e
 
     return None
 
-def detect_motion(options: MotionOptions):
+def detect_motion(options: MotionOptions,
+                  notify: Callable[[str, str, float], None] | None = None):
     """
     Detect motion using Raspberry Pi Camera Module and Picamera2.
 
@@ -198,23 +556,32 @@ def detect_motion(options: MotionOptions):
 
     Args:
         options: MotionOptions object with motion configuration
+        notify: Called with the image, trigger image, and image delay when
+            there is motion. Sends an email if not given.
     """
 
-    email_options = send_email.get_email_config()
+    if notify is None:
+        email_options = send_email.get_email_config()
+
+        def notify(image_path, trigger_image_path, seconds):
+            send_email.send_email(email_options, image_path, trigger_image_path, seconds)
 
     while True:
-        now = time.localtime().tm_hour
+        now = options.clock.localtime().tm_hour
         if (now >= options.max_hour or now < options.min_hour):
             logger.info("Sleeping for 10m since current hour out of range. %d < %d <= %d", options.min_hour, now, options.max_hour)
-            time.sleep(10*60)
+            with span("schedule sleep"):
+                options.clock.sleep(10*60)
             continue
         image_path, triggerImage = detect_motion_ai_camera(options)
 
-        send_email.send_email(email_options, image_path, triggerImage, options.image_delay_seconds)
+        with span("send email"):
+            notify(image_path, triggerImage, options.image_delay_seconds)
 
         # wait before sending another email
         logger.info("Sleeping for %d minutes since just sent an email", options.time_limit_minutes)
-        time.sleep(options.time_limit_minutes*60)
+        with span("cooldown sleep"):
+            options.clock.sleep(options.time_limit_minutes*60)
 
 if __name__ == "__main__":
     config = setup()
@@ -0,0 +1,278 @@
+#! /usr/bin/env python3
+"""
+Shares the camera frames with other local processes, such as a recorder or
+a time-lapse, so they don't have to open the camera, which only one
+process can do.
+
+The watcher publishes each frame into a ring of slots in shared memory.
+Subscribers get NumPy views of the slots, without copying. The publisher
+never waits for subscribers, so a slow one can't slow down capture, but it
+can miss frames, and a slot it is reading can be overwritten. Check
+valid(sequence) after using a view, or use copy().
+
+When the frame size or type changes, the publisher marks the ring closed
+and creates a new one. Subscribers then attach to the new ring, and its
+sequence numbers start again from 1.
+
+Run this to see the frame rate of a bus:
+
+    python3 frame_bus.py pet_watcher
+"""
+import atexit
+import logging
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger("detector")
+
+MAGIC = 0x46424653  # FBFS
+VERSION = 2
+# int64 header fields, followed by the sequence number of each slot
+_MAGIC, _VERSION, _SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _DTYPE, _LATEST, _CLOSED = range(9)
+_HEADER_FIELDS = 9
+_ALIGN = 64
+
+
+def _slot_shape(shape: tuple) -> tuple:
+    """ Shape of a frame in a slot, (height, width, channels), 1 channel for gray """
+    return tuple(shape) if len(shape) == 3 else (*shape, 1)
+
+
+def _layout(slots: int, shape: tuple, dtype: np.dtype) -> tuple[int, int]:
+    """ Get the header size and slot size, in bytes """
+    header = (_HEADER_FIELDS + slots) * 8
+    header = (header + _ALIGN - 1) // _ALIGN * _ALIGN
+    slot = int(np.prod(shape)) * dtype.itemsize
+    slot = (slot + _ALIGN - 1) // _ALIGN * _ALIGN
+    return header, slot
+
+
+class FramePublisher:
+    """
+    Publishes frames to a named shared memory ring. It is created on the
+    first frame, since that gives the frame size.
+    """
+    def __init__(self, name: str, slots: int = 4):
+        """
+        Args:
+            name: Name of the shared memory, used by subscribers
+            slots: Frames kept in the ring
+        """
+        self.name = name
+        self.slots = slots
+        self.shm = None
+        self.header = None
+        self.frames = []
+        atexit.register(self.close)
+
+    def publish(self, frame: np.ndarray) -> int:
+        """
+        Copy a frame into the next slot. Never waits on subscribers.
+
+        Returns:
+            The frame's sequence number
+        """
+        shape = _slot_shape(frame.shape)
+        if (self.shm is None or self.frames[0].shape != shape or
+                self.frames[0].dtype != frame.dtype):
+            self._create(shape, frame.dtype)
+
+        sequence = int(self.header[_LATEST]) + 1
+        slot = sequence % self.slots
+        # a negative sequence marks the slot as being written
+        self.header[_HEADER_FIELDS + slot] = -sequence
+        np.copyto(self.frames[slot], frame.reshape(shape))
+        self.header[_HEADER_FIELDS + slot] = sequence
+        self.header[_LATEST] = sequence
+        return sequence
+
+    def close(self) -> None:
+        """ Remove the shared memory, telling subscribers it is gone """
+        if self.shm is None:
+            return
+        self.header[_CLOSED] = 1
+        self.header = None
+        self.frames = []
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def _create(self, shape: tuple, dtype: np.dtype) -> None:
+        self.close()
+        header_size, slot_size = _layout(self.slots, shape, dtype)
+        size = header_size + slot_size * self.slots
+        try:
+            self.shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            # left over from a run that crashed
+            stale = shared_memory.SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+
+        self.header = np.ndarray((_HEADER_FIELDS + self.slots,), np.int64, self.shm.buf)
+        self.header[:] = 0
+        self.frames = [np.ndarray(shape, dtype, self.shm.buf, header_size + slot * slot_size)
+                       for slot in range(self.slots)]
+        self.header[_SLOTS] = self.slots
+        self.header[_HEIGHT], self.header[_WIDTH], self.header[_CHANNELS] = shape
+        self.header[_DTYPE] = ord(dtype.char)
+        self.header[_VERSION] = VERSION
+        self.header[_MAGIC] = MAGIC
+        logger.info("Publishing %dx%d frames to shared memory %s", shape[1], shape[0], self.name)
+
+
+class FrameSubscriber:
+    """
+    Reads frames published by a FramePublisher in another process
+    """
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Name of the shared memory given to the publisher
+
+        Raises:
+            FileNotFoundError: if nothing is publishing with that name
+            ValueError: if the shared memory isn't a frame bus
+        """
+        self.name = name
+        # counts the rings attached to, so callers can tell sequence numbers restarted
+        self.generation = 0
+        self.slots = 0
+        self.shm = None
+        self.header = None
+        self.frames = []
+        self._open()
+
+    def _open(self) -> None:
+        shm = _attach(self.name)
+        header = np.ndarray((_HEADER_FIELDS,), np.int64, shm.buf)
+        if header[_MAGIC] != MAGIC or header[_VERSION] != VERSION:
+            del header
+            shm.close()
+            raise ValueError(f"{self.name} is not a frame bus")
+
+        slots = int(header[_SLOTS])
+        shape = (int(header[_HEIGHT]), int(header[_WIDTH]), int(header[_CHANNELS]))
+        dtype = np.dtype(chr(int(header[_DTYPE])))
+        header_size, slot_size = _layout(slots, shape, dtype)
+        if self.shm is not None:
+            self.close()
+        self.shm = shm
+        self.slots = slots
+        self.header = np.ndarray((_HEADER_FIELDS + slots,), np.int64, shm.buf)
+        self.frames = [np.ndarray(shape, dtype, shm.buf, header_size + slot * slot_size)
+                       for slot in range(slots)]
+        self.generation += 1
+
+    def reattach(self) -> bool:
+        """
+        Attach to the publisher's new ring if the one attached to was closed.
+        Views of the old ring stay usable, but are no longer updated.
+
+        Returns:
+            True if attached to a new ring
+        """
+        if not self.header[_CLOSED]:
+            return False
+        try:
+            self._open()
+        except (FileNotFoundError, ValueError):
+            # the new ring isn't ready yet, try again later
+            return False
+        logger.info("Frame bus %s changed to %s %s", self.name,
+                    self.frames[0].shape, self.frames[0].dtype)
+        return True
+
+    @property
+    def latest_sequence(self) -> int:
+        """ Sequence number of the newest frame, 0 if none yet """
+        self.reattach()
+        return int(self.header[_LATEST])
+
+    def valid(self, sequence: int) -> bool:
+        """ True if the frame with this sequence number hasn't been overwritten """
+        return 0 < sequence == self.header[_HEADER_FIELDS + sequence % self.slots]
+
+    def latest(self) -> tuple[int, np.ndarray | None]:
+        """
+        Get the newest frame, as a view into shared memory
+
+        Returns:
+            (sequence, frame), or (0, None) if there is no frame yet
+        """
+        sequence = self.latest_sequence
+        if not self.valid(sequence):
+            return 0, None
+        return sequence, self.frames[sequence % self.slots]
+
+    def next(self, after: int, timeout: float = 1.0,
+             poll_seconds: float = 0.005) -> tuple[int, np.ndarray | None]:
+        """
+        Wait for a frame newer than after. If frames were missed, the newest
+        one is returned. If the publisher started a new ring, sequence
+        numbers start again, so any frame in it is newer.
+
+        Returns:
+            (sequence, frame), or (after, None) on timeout, with after
+            reset to 0 if there is a new ring
+        """
+        deadline = time.monotonic() + timeout
+        generation = self.generation
+        while True:
+            sequence, frame = self.latest()
+            if self.generation != generation:
+                generation, after = self.generation, 0
+            if sequence > after:
+                return sequence, frame
+            if time.monotonic() >= deadline:
+                return after, None
+            time.sleep(poll_seconds)
+
+    def copy(self, sequence: int) -> np.ndarray | None:
+        """ Copy a frame out of shared memory, None if it was overwritten """
+        if not self.valid(sequence):
+            return None
+        frame = self.frames[sequence % self.slots].copy()
+        return frame if self.valid(sequence) else None
+
+    def close(self) -> None:
+        """ Detach from the shared memory, leaving it for the publisher """
+        self.header = None
+        self.frames = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # the caller still has views of the frames, it is unmapped with them
+            pass
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to existing shared memory without the resource tracker removing
+    it when this process exits, since the publisher owns it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False) # pylint: disable=E1123
+    shm = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(shm._name, "shared_memory") # pylint: disable=W0212
+    return shm
+
+
+if __name__ == "__main__":
+    subscriber = FrameSubscriber(sys.argv[1] if len(sys.argv) > 1 else "pet_watcher")
+    print(f"Frames are {subscriber.frames[0].shape} {subscriber.frames[0].dtype}")
+    last, count, started = subscriber.latest_sequence, 0, time.monotonic()
+    try:
+        while True:
+            last, view = subscriber.next(last)
+            if view is not None:
+                count += 1
+            if time.monotonic() - started >= 5:
+                print(f"{count / (time.monotonic() - started):.1f} fps, sequence {last}")
+                count, started = 0, time.monotonic()
+    except KeyboardInterrupt:
+        subscriber.close()
@@ -0,0 +1,243 @@
+#! /usr/bin/env python3
+"""
+Per-pixel count of how often each pixel is over the motion threshold, kept
+in a memory-mapped file per day, so it uses almost no RAM and survives
+restarts.
+
+Run this to render a day's heatmap, and to suggest exclude_zones for
+motion.ini that cover the pixels that fire all the time:
+
+    python3 heatmap.py [heatmap file] [--out heatmap.png] [--min-fraction 0.2]
+"""
+import argparse
+import configparser
+import glob
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+# pylint: disable=I1101
+# Module 'cv2' has no '...' member.
+
+logger = logging.getLogger("detector")
+
+MAGIC = 0x4D485750  # PWHM
+VERSION = 1
+# uint32 header fields
+_MAGIC, _VERSION, _HEIGHT, _WIDTH, _ITEMSIZE, _FRAMES = range(6)
+_HEADER_FIELDS = 8
+_HEADER_BYTES = _HEADER_FIELDS * 4
+DTYPES = {"uint16": np.uint16, "uint32": np.uint32}
+
+
+def heatmap_path(directory: str, when: float | None = None) -> str:
+    """ Get the path of the heatmap file for a day """
+    return os.path.join(directory, time.strftime("heatmap-%Y%m%d.bin", time.localtime(when)))
+
+
+def open_heatmap(path: str, shape: tuple | None = None,
+                 dtype=np.uint32) -> tuple[np.memmap, np.memmap]:
+    """
+    Open a heatmap file, creating it if it doesn't exist and a shape is given
+
+    Returns:
+        (header, counts) memory maps
+    """
+    if os.path.exists(path):
+        header = np.memmap(path, np.uint32, "r+", 0, (_HEADER_FIELDS,))
+        if header[_MAGIC] != MAGIC or header[_VERSION] != VERSION:
+            raise ValueError(f"{path} is not a heatmap")
+        dtype = np.uint16 if header[_ITEMSIZE] == 2 else np.uint32
+        file_shape = (int(header[_HEIGHT]), int(header[_WIDTH]))
+        if shape is not None and tuple(shape) != file_shape:
+            raise ValueError(f"{path} is {file_shape}, not {shape}")
+        counts = np.memmap(path, dtype, "r+", _HEADER_BYTES, file_shape)
+        return header, counts
+
+    if shape is None:
+        raise FileNotFoundError(path)
+    dtype = np.dtype(dtype)
+    header = np.memmap(path, np.uint32, "w+", 0,
+                       (_HEADER_FIELDS + (shape[0] * shape[1] * dtype.itemsize + 3) // 4,))
+    header[_HEIGHT], header[_WIDTH] = shape
+    header[_ITEMSIZE] = dtype.itemsize
+    header[_VERSION] = VERSION
+    header[_MAGIC] = MAGIC
+    header.flush()
+    header = np.memmap(path, np.uint32, "r+", 0, (_HEADER_FIELDS,))
+    counts = np.memmap(path, dtype, "r+", _HEADER_BYTES, tuple(shape))
+    return header, counts
+
+
+def remove_old(directory: str, oldest: float) -> None:
+    """ Remove the heatmap files of days before the day of oldest """
+    # the names sort by date
+    cutoff = os.path.basename(heatmap_path(directory, oldest))
+    for path in glob.glob(os.path.join(directory, "heatmap-*.bin")):
+        if os.path.basename(path) < cutoff:
+            os.remove(path)
+            logger.info("Removed old heatmap %s", path)
+
+
+class ActivityHeatmap:
+    """
+    Adds each frame's threshold mask to the day's heatmap file
+    """
+    def __init__(self, directory: str, dtype: str = "uint32", keep_days: int = 30):
+        """
+        Args:
+            directory: Where the daily files are kept
+            dtype: uint32, or uint16 which is half the size but saturates
+                after 65535 frames
+            keep_days: Days of files kept, counting today, 0 to keep them all
+        """
+        self.directory = directory
+        self.dtype = DTYPES[dtype]
+        self.keep_days = keep_days
+        self.header = None
+        self.counts = None
+        self.rollover_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, mask, shape: tuple) -> None:
+        """
+        Count the pixels of a mask that are set.
+
+        Args:
+            mask: Threshold image, 0 or 255
+            shape: (height, width) of the frame. The mask is scaled up to it
+                if it was detected on a scaled down frame.
+        """
+        now = time.time()
+        if self.counts is None or now >= self.rollover_at or self.counts.shape != tuple(shape):
+            self._open(now, shape)
+
+        if mask.shape != self.counts.shape:
+            mask = cv2.resize(mask, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+        if self.dtype == np.uint16:
+            # saturating, in place, only where the mask is set
+            cv2.add(self.counts, 1, dst=self.counts, mask=mask, dtype=cv2.CV_16U)
+        else:
+            np.add(self.counts, 1, out=self.counts, where=mask > 0)
+        self.header[_FRAMES] += 1
+
+    def close(self) -> None:
+        """ Flush and close the current file """
+        if self.counts is not None:
+            self.counts.flush()
+            self.header.flush()
+        self.header = None
+        self.counts = None
+
+    def _open(self, now: float, shape: tuple) -> None:
+        self.close()
+        if self.keep_days > 0:
+            remove_old(self.directory, now - (self.keep_days - 1) * 24 * 60 * 60)
+        path = heatmap_path(self.directory, now)
+        try:
+            self.header, self.counts = open_heatmap(path, shape, self.dtype)
+        except ValueError as e:
+            logger.warning("Starting a new heatmap: %s", e)
+            os.remove(path)
+            self.header, self.counts = open_heatmap(path, shape, self.dtype)
+        logger.info("Heatmap in %s has %d frames", path, self.header[_FRAMES])
+
+        # roll over at the next local midnight
+        tomorrow = time.localtime(now + 24 * 60 * 60)
+        self.rollover_at = time.mktime((tomorrow.tm_year, tomorrow.tm_mon, tomorrow.tm_mday,
+                                        0, 0, 0, 0, 0, -1))
+
+
+def render(counts: np.ndarray, frames: int):
+    """ Color image of the fraction of frames each pixel fired in """
+    fraction = counts.astype(np.float32) / max(frames, 1)
+    scaled = np.clip(fraction / max(float(fraction.max()), 1e-6) * 255, 0, 255).astype(np.uint8)
+    return cv2.applyColorMap(scaled, cv2.COLORMAP_JET)
+
+
+def suggest_zones(counts: np.ndarray, frames: int, min_fraction: float,
+                  min_area: int = 100) -> list[tuple[int, int, int, int]]:
+    """
+    Get (x, y, w, h) boxes around the pixels that fire in at least
+    min_fraction of the frames
+
+    Args:
+        counts: Heatmap counts
+        frames: Frames counted
+        min_fraction: Fraction of frames a pixel must fire in
+        min_area: Smaller areas are ignored
+    """
+    hot = (counts >= max(min_fraction * frames, 1)).astype(np.uint8) * 255
+    hot = cv2.dilate(hot, None, iterations=2)
+    contours, _ = cv2.findContours(hot, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [cv2.boundingRect(contour) for contour in contours
+            if cv2.contourArea(contour) >= min_area]
+
+
+def format_zones(zones: list) -> str:
+    """ Format zones for exclude_zones in motion.ini """
+    return "; ".join(",".join(str(value) for value in zone) for zone in zones)
+
+
+def parse_zones(zones: str) -> list[tuple[int, int, int, int]]:
+    """
+    Parse exclude_zones from motion.ini, x,y,w,h; x,y,w,h
+
+    Raises:
+        ValueError: if a zone isn't four whole numbers
+    """
+    ret = []
+    for zone in zones.split(";"):
+        if not zone.strip():
+            continue
+        try:
+            x, y, w, h = (int(value) for value in zone.split(",")) # pylint: disable=C0103
+        except ValueError as e: # pylint: disable=C0103
+            raise ValueError(f"exclude zone '{zone.strip()}' isn't x,y,w,h") from e
+        ret.append((x, y, w, h))
+    return ret
+
+
+def main():
+    """ Render a heatmap and suggest exclusion zones """
+    motion_config = configparser.ConfigParser()
+    motion_config.read('motion.ini')
+    directory = motion_config.get('motion', 'heatmap_dir', fallback='heatmap') or 'heatmap'
+
+    parser = argparse.ArgumentParser(description="Render a motion heatmap and suggest zones.")
+    parser.add_argument("file", nargs="?", help="Heatmap file, the latest if not given")
+    parser.add_argument("--out", default="heatmap.png", help="Image to write.")
+    parser.add_argument("--min-fraction", type=float, default=0.2,
+                        help="Fraction of frames a pixel fires in to exclude it.")
+    parser.add_argument("--min-area", type=int, default=100,
+                        help="Smallest area to suggest excluding.")
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        files = sorted(glob.glob(os.path.join(directory, "heatmap-*.bin")))
+        if not files:
+            print(f"No heatmaps in {directory}")
+            return
+        path = files[-1]
+
+    header, counts = open_heatmap(path)
+    frames = int(header[_FRAMES])
+    cv2.imwrite(args.out, render(counts, frames))
+    print(f"{path}: {frames} frames, busiest pixel fired in "
+          f"{int(counts.max())} of them. Image written to {args.out}")
+
+    zones = suggest_zones(counts, frames, args.min_fraction, args.min_area)
+    if zones:
+        print("Pixels firing in more than "
+              f"{args.min_fraction:.0%} of frames. To ignore them, add to motion.ini")
+        print(f"exclude_zones = {format_zones(zones)}")
+    else:
+        print(f"No areas fire in more than {args.min_fraction:.0%} of frames")
+
+
+if __name__ == "__main__":
+    main()
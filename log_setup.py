@@ -0,0 +1,125 @@
+"""
+Logging setup that keeps file I/O off the frame loop thread
+"""
+import atexit
+import configparser
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+logger = logging.getLogger("detector")
+
+
+class LogOptions: # pylint: disable=R0902,R0903
+    """ This class is used to store the logging options """
+    def __init__(self, log_config: dict):
+        if log_config is None:
+            return
+
+        # optional fields
+        self.log_file = log_config.get('log_file', 'log.txt')
+        self.max_bytes = log_config.getint('max_bytes', 1024 * 1024)
+        self.backup_count = log_config.getint('backup_count', 3)
+        self.level = log_config.get('level', 'DEBUG').upper()
+
+    @staticmethod
+    def get_log_options():
+        """
+        Get the logging options from the configuration file. Defaults are
+        used if there is no [logging] section.
+        """
+        log_config = configparser.ConfigParser()
+        log_config.read('motion.ini')
+        if not log_config.has_section('logging'):
+            log_config['logging'] = {}
+        return LogOptions(log_config['logging'])
+
+
+def setup_logging(options: LogOptions) -> logging.handlers.QueueListener:
+    """
+    Setup the detector logger so records are put on a queue by the caller
+    and formatted and written by a background thread.
+
+    The log file is rotated by size. If stderr is a terminal, records are
+    also written there, so running in the foreground still shows output.
+
+    Args:
+        options: LogOptions object with logging configuration
+
+    Returns:
+        The started QueueListener. It is stopped at exit.
+    """
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    handlers = []
+    if options.log_file:
+        file_handler = logging.handlers.RotatingFileHandler(options.log_file,
+                                                            maxBytes=options.max_bytes,
+                                                            backupCount=options.backup_count)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    if sys.stderr.isatty() or not handlers:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers,
+                                              respect_handler_level=True)
+
+    logger.setLevel(options.level)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
+
+
+class IntervalSummary:
+    """
+    Summarize a noisy, per-frame value and log it once per interval instead
+    of once per occurrence.
+
+    Usage in a hot loop:
+
+        summary.add(area)
+        ...
+        summary.flush()  # once per frame, cheap unless the interval is up
+    """
+    def __init__(self, message: str, interval_seconds: float):
+        """
+        Args:
+            message: Format string given the count, max value and interval
+            interval_seconds: How often to log the summary, 0 disables it
+        """
+        self.message = message
+        self.interval_seconds = interval_seconds
+        self.enabled = interval_seconds > 0 and logger.isEnabledFor(logging.DEBUG)
+        self.count = 0
+        self.max_value = 0
+        self.started = time.monotonic()
+
+    def add(self, value) -> None:
+        """ Add one occurrence of a value to the summary """
+        self.count += 1
+        if value > self.max_value:
+            self.max_value = value
+
+    def flush(self) -> None:
+        """ Log the summary if the interval has passed """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        elapsed = now - self.started
+        if elapsed < self.interval_seconds:
+            return
+        if self.count:
+            logger.debug(self.message, self.count, self.max_value, elapsed)
+        self.count = 0
+        self.max_value = 0
+        self.started = now
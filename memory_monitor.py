@@ -0,0 +1,145 @@
+"""
+Memory footprint tracking for long runs, to find what grows and to reset
+before the OOM killer steps in.
+"""
+import gc
+import linecache
+import logging
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+logger = logging.getLogger("detector")
+
+# Frames of these files are noise in the allocation diffs
+_IGNORED = (tracemalloc.__file__, linecache.__file__, "<frozen importlib._bootstrap>",
+            "<frozen importlib._bootstrap_external>", "<unknown>")
+
+
+def rss_bytes() -> int:
+    """ Get the resident set size of this process, 0 if unknown """
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class MemoryLimitExceeded(Exception):
+    """ Raised when resetting doesn't get RSS back under the soft limit """
+
+
+class MemoryMonitor: # pylint: disable=R0902
+    """
+    Periodically logs RSS and, if tracing, NumPy buffer totals and the
+    allocation sites that grew the most since the last check.
+
+    Tracing uses tracemalloc, which slows every allocation a little, so it
+    is opt-in. Without it only RSS is read, which is very cheap.
+    """
+    def __init__(self, interval_seconds: float, # pylint: disable=R0913
+                 soft_limit_mb: int = 0,
+                 max_resets: int = 3,
+                 trace: bool = False,
+                 trace_frames: int = 1,
+                 top: int = 10):
+        """
+        Args:
+            interval_seconds: How often check does anything
+            soft_limit_mb: RSS that makes check ask for a reset, 0 for none
+            max_resets: Resets in a row, without RSS going back under the
+                limit, before giving up. 0 for no limit.
+            trace: Use tracemalloc to find what is allocating
+            trace_frames: Stack frames kept per allocation when tracing
+            top: Number of allocation sites logged
+        """
+        self.interval_seconds = interval_seconds
+        self.soft_limit_bytes = soft_limit_mb * 1024 * 1024
+        self.max_resets = max_resets
+        self.trace = trace
+        self.trace_frames = trace_frames
+        self.top = top
+
+        self.last_check = time.monotonic()
+        self.snapshot = None
+        self.rss = 0
+        self.peak_rss = 0
+        self.numpy_bytes = 0
+        self.traced_bytes = 0
+        self.resets = 0
+        self.resets_in_a_row = 0
+
+        if trace:
+            tracemalloc.start(trace_frames)
+            self.snapshot = self._take_snapshot()
+
+    def check(self) -> bool:
+        """
+        Check memory use, if the interval has passed. Cheap to call every frame.
+
+        Returns:
+            True if RSS is over the soft limit and the caller should reset
+
+        Raises:
+            MemoryLimitExceeded: if RSS is still over the limit after max_resets
+                resets in a row, so the process should exit and be restarted
+        """
+        now = time.monotonic()
+        if now - self.last_check < self.interval_seconds:
+            return False
+        self.last_check = now
+
+        self.rss = rss_bytes()
+        self.peak_rss = max(self.peak_rss, self.rss)
+
+        if self.trace:
+            snapshot = self._take_snapshot()
+            self.traced_bytes = sum(stat.size for stat in snapshot.statistics("filename"))
+            numpy_snapshot = snapshot.filter_traces(
+                [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)])
+            self.numpy_bytes = sum(trace.size for trace in numpy_snapshot.traces)
+
+            logger.info("Memory: RSS %.1fMB, traced %.1fMB, NumPy buffers %.1fMB",
+                        self.rss / 1e6, self.traced_bytes / 1e6, self.numpy_bytes / 1e6)
+            for stat in snapshot.compare_to(self.snapshot, "lineno")[:self.top]:
+                if stat.size_diff:
+                    logger.info("  %+.1fKB %+d blocks: %s", stat.size_diff / 1024,
+                                stat.count_diff, stat.traceback)
+            self.snapshot = snapshot
+        else:
+            logger.info("Memory: RSS %.1fMB", self.rss / 1e6)
+
+        if not self.soft_limit_bytes or self.rss <= self.soft_limit_bytes:
+            self.resets_in_a_row = 0
+            return False
+
+        if self.max_resets and self.resets_in_a_row >= self.max_resets:
+            raise MemoryLimitExceeded(
+                f"RSS {self.rss / 1e6:.1f}MB is still over the soft limit of "
+                f"{self.soft_limit_bytes / 1e6:.1f}MB after {self.resets_in_a_row} resets")
+        self.resets += 1
+        self.resets_in_a_row += 1
+        logger.warning("RSS %.1fMB is over the soft limit of %.1fMB, resetting (reset %d)",
+                       self.rss / 1e6, self.soft_limit_bytes / 1e6, self.resets)
+        return True
+
+    def after_reset(self) -> None:
+        """ Collect garbage after the caller has dropped its state """
+        gc.collect()
+        logger.info("Memory after reset: RSS %.1fMB", rss_bytes() / 1e6)
+
+    def stats(self) -> dict:
+        """ Get the memory metrics """
+        return {
+            "rss_bytes": self.rss,
+            "peak_rss_bytes": self.peak_rss,
+            "traced_bytes": self.traced_bytes,
+            "numpy_bytes": self.numpy_bytes,
+            "resets": self.resets,
+        }
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, name) for name in _IGNORED])
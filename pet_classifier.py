@@ -0,0 +1,299 @@
+"""
+Decides if the areas with motion show an animal, so an email is only sent
+for a pet and not for a shadow or a curtain.
+
+The classifier runs in a separate process, on the crops of the motion
+areas only, and only when there is motion. Results are cached briefly so a
+crop that barely changes between frames isn't classified again.
+
+Worker processes are started by a fork server, which is itself forked the
+first time one is started, before the camera and the other threads exist.
+So restarting a worker from the frame loop doesn't fork a process with
+threads.
+"""
+import logging
+import multiprocessing
+import time
+
+import cv2
+import numpy as np
+
+# pylint: disable=I1101
+# Module 'cv2' has no '...' member.
+
+logger = logging.getLogger("detector")
+
+# Kinds of classifier
+ONNX = "onnx"
+CAT_FACE = "cat_face"
+
+# Size of the average hash used to tell if a crop has changed
+HASH_SIZE = 8
+
+# Longest wait before restarting a worker that failed
+MAX_RESTART_BACKOFF_SECONDS = 300.0
+
+
+def parse_classes(classes: str) -> set[int]:
+    """
+    Parse a list of class numbers and ranges, like 151-268,281-285
+    """
+    ret = set()
+    for part in classes.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        ret.update(range(int(first), int(last or first) + 1))
+    return ret
+
+
+class _OnnxModel: # pylint: disable=R0903
+    """ Image classification model, like MobileNet, loaded with OpenCV DNN """
+    def __init__(self, model_path: str, input_size: int, animal_classes: set[int]):
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.animal_classes = np.array(sorted(animal_classes), dtype=np.int64)
+
+    def scores(self, crops: list) -> list[float]:
+        """ Get the probability that each crop is an animal, in one batch """
+        # frames from the camera are already RGB, which is what models expect
+        blob = cv2.dnn.blobFromImages(crops, 1.0 / 255,
+                                      (self.input_size, self.input_size),
+                                      swapRB=False, crop=False)
+        self.net.setInput(blob)
+        logits = self.net.forward().reshape(len(crops), -1)
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return probabilities[:, self.animal_classes].sum(axis=1).tolist()
+
+
+class _CatFaceModel: # pylint: disable=R0903
+    """ OpenCV's Haar cascade for cat faces """
+    def __init__(self, model_path: str):
+        if not model_path:
+            model_path = cv2.data.haarcascades + "haarcascade_frontalcatface_extended.xml"
+        self.cascade = cv2.CascadeClassifier(model_path)
+        if self.cascade.empty():
+            raise ValueError(f"Can't load cascade {model_path}")
+
+    def scores(self, crops: list) -> list[float]:
+        """ 1.0 for each crop with a cat face, otherwise 0.0 """
+        ret = []
+        for crop in crops:
+            gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+            faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3,
+                                                  minSize=(24, 24))
+            ret.append(1.0 if len(faces) else 0.0)
+        return ret
+
+
+def _worker(connection, kind: str, model_path: str, input_size: int, animal_classes: set[int]):
+    """ Process that loads the model, then classifies batches of crops until closed """
+    try:
+        if kind == ONNX:
+            model = _OnnxModel(model_path, input_size, animal_classes)
+        else:
+            model = _CatFaceModel(model_path)
+        connection.send(None)
+    except Exception as e: # pylint: disable=C0103,W0718
+        connection.send(str(e))
+        return
+
+    while True:
+        try:
+            crops = connection.recv()
+        except EOFError:
+            return
+        try:
+            connection.send(model.scores(crops))
+        except Exception as e: # pylint: disable=C0103,W0718
+            connection.send(str(e))
+
+
+def _average_hash(crop) -> np.ndarray:
+    """ Small fingerprint of a crop that changes little when the crop does """
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    return small > small.mean()
+
+
+class PetClassifier: # pylint: disable=R0902
+    """
+    Classifies motion areas as animal or not, in a worker process
+    """
+    def __init__(self, kind: str, model_path: str, # pylint: disable=R0913
+                 input_size: int = 224,
+                 animal_classes: set[int] | None = None,
+                 min_confidence: float = 0.5,
+                 cache_seconds: float = 10.0,
+                 timeout_seconds: float = 2.0,
+                 load_timeout_seconds: float = 60.0,
+                 restart_backoff_seconds: float = 10.0):
+        """
+        Args:
+            kind: ONNX or CAT_FACE
+            model_path: ONNX file, or cascade XML file for CAT_FACE
+            input_size: Width and height of the ONNX model's input
+            animal_classes: ONNX output classes that are animals
+            min_confidence: Score needed to be an animal
+            cache_seconds: How long the result for a crop is reused
+            timeout_seconds: How long to wait for the worker to classify a batch
+            load_timeout_seconds: How long to wait for the worker to load the model
+            restart_backoff_seconds: First wait before restarting a worker
+                that failed, doubled each time it fails again
+        """
+        if kind not in (ONNX, CAT_FACE):
+            raise ValueError(f"Unknown classifier {kind}")
+        self.kind = kind
+        self.model_path = model_path
+        self.input_size = input_size
+        self.animal_classes = animal_classes or set()
+        self.min_confidence = min_confidence
+        self.cache_seconds = cache_seconds
+        self.timeout_seconds = timeout_seconds
+        self.load_timeout_seconds = load_timeout_seconds
+        self.restart_backoff_seconds = restart_backoff_seconds
+
+        # list of (time, hash, score) of recently classified crops
+        self.cache = []
+        self.process = None
+        self.connection = None
+        self.context = multiprocessing.get_context("forkserver")
+        self.backoff_seconds = restart_backoff_seconds
+        self.restart_at = 0.0
+        self.failures = 0
+
+    def start(self) -> None:
+        """
+        Start the worker process and wait for the model to load. Do this the
+        first time before the camera is opened, since that starts the fork
+        server.
+
+        Raises:
+            RuntimeError: if the model didn't load in load_timeout_seconds
+        """
+        self.connection, child = self.context.Pipe()
+        self.process = self.context.Process(target=_worker, name="classifier", daemon=True,
+                                            args=(child, self.kind, self.model_path,
+                                                  self.input_size, self.animal_classes))
+        self.process.start()
+        child.close()
+        try:
+            if not self.connection.poll(self.load_timeout_seconds):
+                raise TimeoutError(f"not loaded in {self.load_timeout_seconds}s")
+            error = self.connection.recv()
+        except (OSError, EOFError, TimeoutError) as e: # pylint: disable=C0103
+            error = str(e) or type(e).__name__
+        if error is not None:
+            self.stop()
+            raise RuntimeError(f"Classifier didn't load: {error}")
+        logger.info("Classifier %s started from %s", self.kind, self.model_path or "default")
+
+    def stop(self) -> None:
+        """ Stop the worker process """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+            self.process = None
+
+    def reset(self) -> None:
+        """
+        Drop the cached results and restart the worker, to free the memory they hold
+        """
+        self.cache = []
+        self.stop()
+        try:
+            self.start()
+        except Exception as e: # pylint: disable=C0103,W0718
+            logger.warning("Classifier didn't restart, will retry when needed: %s", e)
+            self.stop()
+
+    def is_animal(self, frame, boxes: list) -> bool:
+        """
+        Check if any of the motion areas of a frame shows an animal. If the
+        worker fails or is too slow, this says it is, so no alert is lost.
+
+        Args:
+            frame: RGB image
+            boxes: (x, y, w, h) of the areas with motion
+        """
+        now = time.monotonic()
+        self.cache = [entry for entry in self.cache if now - entry[0] < self.cache_seconds]
+
+        crops = []
+        hashes = []
+        for box in boxes:
+            crop = self._crop(frame, box)
+            crop_hash = _average_hash(crop)
+            score = self._cached_score(crop_hash)
+            if score is not None:
+                if score >= self.min_confidence:
+                    logger.debug("Cached classifier score %.2f for %s", score, box)
+                    return True
+                continue
+            crops.append(crop)
+            hashes.append(crop_hash)
+
+        if not crops:
+            return False
+
+        scores = self._classify(crops)
+        if scores is None:
+            return True
+
+        for crop_hash, score in zip(hashes, scores):
+            self.cache.append((now, crop_hash, score))
+        logger.debug("Classifier scores %s in %.0fms",
+                     ", ".join(f"{score:.2f}" for score in scores),
+                     (time.monotonic() - now) * 1000)
+        return max(scores) >= self.min_confidence
+
+    def _classify(self, crops: list) -> list[float] | None:
+        """
+        Classify a batch of crops in the worker, None if that fails. A worker
+        that failed is only restarted once its backoff has passed.
+        """
+        if self.process is None and time.monotonic() < self.restart_at:
+            return None
+        try:
+            if self.process is None:
+                self.start()
+            self.connection.send(crops)
+            if not self.connection.poll(self.timeout_seconds):
+                raise TimeoutError(f"no result in {self.timeout_seconds}s")
+            result = self.connection.recv()
+            if isinstance(result, str):
+                raise RuntimeError(result)
+        except Exception as e: # pylint: disable=C0103,W0718
+            self.stop()
+            self.failures += 1
+            self.restart_at = time.monotonic() + self.backoff_seconds
+            logger.warning("Classifier failed, assuming an animal, restarting in %.0fs "
+                           "(failure %d): %s", self.backoff_seconds, self.failures, e)
+            self.backoff_seconds = min(self.backoff_seconds * 2, MAX_RESTART_BACKOFF_SECONDS)
+            return None
+        self.backoff_seconds = self.restart_backoff_seconds
+        return result
+
+    def _cached_score(self, crop_hash) -> float | None:
+        for _, cached_hash, score in self.cache:
+            if np.count_nonzero(cached_hash != crop_hash) <= HASH_SIZE // 2:
+                return score
+        return None
+
+    @staticmethod
+    def _crop(frame, box):
+        """ Crop a box, with a margin, out of the frame """
+        x, y, w, h = box # pylint: disable=C0103
+        margin = max(w, h) // 10
+        height, width = frame.shape[:2]
+        return frame[max(y - margin, 0):min(y + h + margin, height),
+                     max(x - margin, 0):min(x + w + margin, width)]
@@ -3,29 +3,23 @@
 This is the main script for the pet-watcher project.
 """
 import logging
-import logging.config
 
 import detect_motion
+import log_setup
 
 logger = logging.getLogger("detector")
-logger.setLevel(logging.DEBUG)
 
-# Create console handler with a higher log level
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)  # Set to DEBUG to capture all messages
+# The classifier's worker processes import this module, so only run as the main script
+if __name__ == "__main__":
+    # Log records are queued and written to a rotating file by a background
+    # thread so the frame loop never waits on the SD card
+    log_setup.setup_logging(log_setup.LogOptions.get_log_options())
 
-# Create formatter and add it to the handler
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-ch.setFormatter(formatter)
+    config = detect_motion.setup()
 
-# Add the handler to the logger
-logger.addHandler(ch)
-
-config = detect_motion.setup()
-
-if config is None:
-    logger.error('Missing config in motion.ini')
-elif config.picam2 is None:
-    logger.error('Camera not initialized')
-else:
-    detect_motion.detect_motion(config)
+    if config is None:
+        logger.error('Missing config in motion.ini')
+    elif config.picam2 is None:
+        logger.error('Camera not initialized')
+    else:
+        detect_motion.detect_motion(config)
@@ -0,0 +1,189 @@
+"""
+MJPEG live preview over HTTP for tuning headless units over the LAN.
+
+Streams:
+    /raw        camera feed with motion rectangles
+    /delta      difference between frames
+    /threshold  thresholded, dilated difference
+    /status     JSON of the metrics of registered status providers
+
+Frames are only kept when a client is watching a stream, and each frame is
+encoded once on a server thread no matter how many clients are watching.
+"""
+import http.server
+import json
+import logging
+import threading
+import time
+
+import cv2
+
+# pylint: disable=I1101
+# Module 'cv2' has no '...' member.
+
+logger = logging.getLogger("detector")
+
+BOUNDARY = "frame"
+STREAMS = ("raw", "delta", "threshold")
+
+class _Stream: # pylint: disable=R0902,R0903
+    """ Latest frame of one stream, and its JPEG once encoded """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.encode_lock = threading.Lock()
+        self.clients = 0
+        self.frame = None
+        self.conversion = None
+        self.sequence = 0
+        self.jpeg = None
+        self.jpeg_sequence = 0
+        self.last_published = 0.0
+
+    def jpeg_after(self, sequence: int, quality: int, timeout: float):
+        """
+        Wait for a frame newer than sequence and return (sequence, jpeg bytes).
+        The first client to get here encodes it, the rest reuse that encoding.
+        Encoding is done outside of the condition so publish never waits on it.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > sequence, timeout):
+                return sequence, None
+            sequence, frame, conversion = self.sequence, self.frame, self.conversion
+
+        with self.encode_lock:
+            if self.jpeg_sequence < sequence:
+                if conversion is not None:
+                    frame = cv2.cvtColor(frame, conversion)
+                ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                self.jpeg = jpeg.tobytes() if ok else None
+                self.jpeg_sequence = sequence
+            return self.jpeg_sequence, self.jpeg
+
+
+class PreviewServer:
+    """
+    HTTP server, on a background thread, streaming the detection images
+    """
+    def __init__(self, port: int, max_fps: float, quality: int = 75):
+        """
+        Args:
+            port: TCP port to listen on, on all interfaces
+            max_fps: Maximum frames per second sent to clients
+            quality: JPEG quality of the preview images
+        """
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.quality = quality
+        self.streams = {name: _Stream() for name in STREAMS}
+        # name to function returning a dict of metrics for /status
+        self.status_providers = {}
+        self.server = http.server.ThreadingHTTPServer(("", port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="preview", daemon=True)
+
+    def start(self) -> None:
+        """ Start serving on a background thread """
+        self.thread.start()
+        logger.info("Preview server listening on port %d", self.server.server_address[1])
+
+    def stop(self) -> None:
+        """ Stop the server """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wants(self, name: str) -> bool:
+        """
+        True if someone is watching the stream and it is time for a new frame.
+        Check this before doing any work only needed for the preview.
+        """
+        stream = self.streams[name]
+        return (stream.clients > 0 and
+                time.monotonic() - stream.last_published >= self.min_interval)
+
+    def publish(self, name: str, frame, conversion: int | None = None) -> None:
+        """
+        Offer a frame to a stream. This is cheap: it keeps a reference to the
+        frame and encoding is done later on a server thread, so the frame
+        must not be modified after it is published.
+
+        Args:
+            name: one of STREAMS
+            frame: image to send
+            conversion: optional cv2.COLOR_* conversion done before encoding
+        """
+        if not self.wants(name):
+            return
+        stream = self.streams[name]
+        with stream.condition:
+            stream.frame = frame
+            stream.conversion = conversion
+            stream.sequence += 1
+            stream.last_published = time.monotonic()
+            stream.condition.notify_all()
+
+    def _handler_class(self):
+        preview = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """ Serves the MJPEG streams """
+            def do_GET(self): # pylint: disable=C0103
+                """ Handle a GET of an index page, or a stream """
+                name = self.path.strip("/").split("?")[0]
+                if name == "":
+                    self._send_index()
+                elif name == "status":
+                    self._send_status()
+                elif name in preview.streams:
+                    self._send_stream(preview.streams[name])
+                else:
+                    self.send_error(404)
+
+            def _send_index(self):
+                links = "".join(f'<h3>{name}</h3><img src="/{name}"><br>' for name in STREAMS)
+                links += '<a href="/status">status</a>'
+                body = f"<html><body>{links}</body></html>".encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_status(self):
+                status = {name: provider() for name, provider in preview.status_providers.items()}
+                body = json.dumps(status, indent=2).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, stream: _Stream):
+                self.send_response(200)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Content-Type",
+                                 f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.end_headers()
+
+                with stream.condition:
+                    stream.clients += 1
+                sequence = stream.sequence
+                try:
+                    while True:
+                        sequence, jpeg = stream.jpeg_after(sequence, preview.quality, 5.0)
+                        if jpeg is None:
+                            continue
+                        self.wfile.write(f"--{BOUNDARY}\r\n"
+                                         "Content-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with stream.condition:
+                        stream.clients -= 1
+
+            def log_message(self, format, *args): # pylint: disable=W0622
+                logger.debug("Preview %s - %s", self.address_string(), format % args)
+
+        return Handler
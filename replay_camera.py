@@ -0,0 +1,68 @@
+"""
+Stand-in for Picamera2 that plays back frames, for testing without a camera.
+"""
+import os
+import threading
+import time
+
+
+class ReplayCamera:
+    """
+    Plays back a list of frames, looping, with the part of the Picamera2 API
+    used by the detector. Stalls can be injected to test the watchdog.
+    """
+    def __init__(self, frames: list, stalls: dict | None = None, frame_seconds: float = 0.0):
+        """
+        Args:
+            frames: Images to return from capture_array, in order
+            stalls: Frame number to seconds that capture hangs before returning
+                that frame. None seconds hangs until the camera is stopped.
+            frame_seconds: Time each capture takes, to simulate a frame rate
+        """
+        self.frames = frames
+        self.stalls = stalls or {}
+        self.frame_seconds = frame_seconds
+        self.frame_number = 0
+        self.started = False
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def from_directory(path: str, **kwargs):
+        """
+        Create a ReplayCamera from the images in a directory, in name order
+        """
+        import cv2 # pylint: disable=C0415
+        names = sorted(name for name in os.listdir(path)
+                       if name.lower().endswith((".jpg", ".jpeg", ".png")))
+        frames = [cv2.imread(os.path.join(path, name)) for name in names]
+        return ReplayCamera(frames, **kwargs)
+
+    def start(self) -> None:
+        """ Start the camera """
+        self.started = True
+        self._stopped.clear()
+
+    def stop(self) -> None:
+        """ Stop the camera, releasing any hung capture """
+        self.started = False
+        self._stopped.set()
+
+    def close(self) -> None:
+        """ Close the camera """
+        self.stop()
+
+    def capture_array(self, name: str = "main"): # pylint: disable=W0613
+        """ Get the next frame, after any stall injected for it """
+        if not self.started:
+            raise RuntimeError("Camera not started")
+
+        frame_number = self.frame_number
+        self.frame_number += 1
+        if frame_number in self.stalls:
+            seconds = self.stalls[frame_number]
+            self._stopped.wait(seconds)
+            if not self.started:
+                raise RuntimeError("Camera stopped during capture")
+        if self.frame_seconds:
+            time.sleep(self.frame_seconds)
+        return self.frames[frame_number % len(self.frames)].copy()
@@ -2,22 +2,34 @@
 
 run()
 {
-    rm log.txt || true
-    python3 pet_watcher.py > log.txt 2>&1 &
+    # pet_watcher.py writes and rotates log.txt itself, stderr only gets crashes
+    python3 pet_watcher.py > /dev/null 2> stderr.txt &
     echo Running in the background. To see output: tail -f log.txt
 }
 
+calibrate()
+{
+    python3 calibrate.py
+}
+
+test()
+{
+    python3 -m unittest discover -s tests
+}
+
 lint()
 {
-    pylint pet_watcher.py send_email.py detect_motion.py
+    pylint pet_watcher.py send_email.py detect_motion.py log_setup.py preview_server.py camera_watchdog.py replay_camera.py memory_monitor.py pet_classifier.py tracker.py calibrate.py frame_bus.py thermal.py heatmap.py span_trace.py clock.py soak.py
 }
 
 Help()
 {
     echo "Run one or more bash snippets. Enter one or more of the following commands:"
     echo
-    echo "  run    # runs the watcher"
-    echo "  lint   # does lint"
+    echo "  run       # runs the watcher"
+    echo "  calibrate # finds the fastest camera mode"
+    echo "  lint      # does lint"
+    echo "  test      # runs the unit tests"
     echo
 }
 
@@ -33,6 +45,10 @@ while (( "$#")); do
             lint;;
         run)
             run;;
+        calibrate)
+            calibrate;;
+        test)
+            test;;
         *)
             Help;;
     esac
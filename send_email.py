@@ -7,6 +7,14 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 import configparser
 import logging
+import os
+
+import cv2
+
+from span_trace import span
+
+# pylint: disable=I1101
+# Module 'cv2' has no '...' member.
 
 logger = logging.getLogger("detector")
 
@@ -28,6 +36,11 @@ class MailOptions: # pylint: disable=R0902,R0903
         self.subject = mail_config.get('subject', 'Motion Detected')
         self.message = mail_config.get('message','Motion has been detected the Cat Detector Van. '
                                 'Please see the attached image.')
+        # attachment size budget, 0 sends the images as they are
+        self.max_message_bytes = mail_config.getint('max_message_bytes', 0)
+        self.jpeg_quality = mail_config.getint('jpeg_quality', 90)
+        self.min_jpeg_quality = mail_config.getint('min_jpeg_quality', 40)
+        self.progressive_jpeg = mail_config.getboolean('progressive_jpeg', False)
 
 def get_email_config() -> MailOptions | None:
     """
@@ -50,9 +63,112 @@ def get_email_config() -> MailOptions | None:
     logger.info('  Username:   %s', ret.username)
     logger.info('  ApiKey:     %s...', ret.password[:3])
     logger.info('  To:         %s', ret.to_email)
+    logger.info('  Max Bytes:  %s', ret.max_message_bytes or 'no limit')
 
     return ret
 
+# Room left in the message for headers, the html body, and MIME boundaries
+MESSAGE_OVERHEAD_BYTES = 4096
+# Scales tried, in order, when an image doesn't fit at the lowest quality
+SCALES = (1.0, 0.75, 0.5, 0.35, 0.25)
+
+def image_budget(mail_options: MailOptions, image_count: int) -> int:
+    """
+    Get the number of bytes each JPEG can use so the message fits in
+    max_message_bytes, after base64 encoding. 0 if there is no budget.
+    """
+    if mail_options.max_message_bytes <= 0 or image_count == 0:
+        return 0
+    # base64 turns each 57 bytes into a 76 character line plus CRLF
+    available = max(mail_options.max_message_bytes - MESSAGE_OVERHEAD_BYTES, 0)
+    return available * 57 // 78 // image_count
+
+def encode_jpeg(image, quality: int, progressive: bool) -> bytes:
+    """ Encode an image as a JPEG """
+    _, jpeg = cv2.imencode(".jpg", image,
+                           [cv2.IMWRITE_JPEG_QUALITY, quality,
+                            cv2.IMWRITE_JPEG_PROGRESSIVE, int(progressive)])
+    return jpeg.tobytes()
+
+def best_quality(image, budget: int, mail_options: MailOptions) -> tuple[bytes | None, bytes]:
+    """
+    Find the highest quality between min_jpeg_quality and jpeg_quality that
+    fits in budget bytes. Size grows with quality, so it is a binary search.
+
+    Returns:
+        (JPEG at the best quality that fits, None if none do, smallest JPEG tried)
+    """
+    high = mail_options.jpeg_quality
+    low = min(mail_options.min_jpeg_quality, high)
+    best = None
+    smallest = None
+    while low <= high:
+        quality = (low + high) // 2
+        jpeg = encode_jpeg(image, quality, mail_options.progressive_jpeg)
+        if len(jpeg) <= budget:
+            best = jpeg
+            low = quality + 1
+        else:
+            high = quality - 1
+        if smallest is None or len(jpeg) < len(smallest):
+            smallest = jpeg
+    return best, smallest
+
+def fit_image(image_path: str, budget: int, mail_options: MailOptions) -> bytes:
+    """
+    Get a JPEG of the image that fits in budget bytes, using the highest
+    quality that fits, and only scaling the image down if the lowest
+    quality doesn't fit.
+
+    Args:
+        image_path: Path to the image
+        budget: Maximum size of the JPEG, 0 for no limit
+        mail_options: MailOptions object with the quality settings
+
+    Returns:
+        The JPEG bytes. If nothing fits, the smallest one tried.
+    """
+    # re-encoding loses quality and takes time, so only do it when needed
+    if not mail_options.progressive_jpeg and (budget <= 0 or
+                                              os.path.getsize(image_path) <= budget):
+        with open(image_path, "rb") as attachment:
+            return attachment.read()
+
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Can't read image {image_path}")
+
+    if budget <= 0:
+        return encode_jpeg(image, mail_options.jpeg_quality, mail_options.progressive_jpeg)
+
+    height, width = image.shape[:2]
+    smallest = None
+    for scale in SCALES:
+        scaled = image if scale == 1.0 else cv2.resize(image,
+                                                       (int(width * scale), int(height * scale)),
+                                                       interpolation=cv2.INTER_AREA)
+        best, tried = best_quality(scaled, budget, mail_options)
+        if best is not None:
+            logger.debug("Image %s is %d bytes at scale %.2f, budget %d",
+                         image_path, len(best), scale, budget)
+            return best
+        if smallest is None or len(tried) < len(smallest):
+            smallest = tried
+
+    logger.warning("Image %s is %d bytes, over the budget of %d",
+                   image_path, len(smallest), budget)
+    return smallest
+
+def attach_image(msg: MIMEMultipart, image_path: str, content_id: str, budget: int,
+                 mail_options: MailOptions) -> None:
+    """
+    Attach an image, fitted to budget bytes, to be shown inline as cid:content_id
+    """
+    with span("fit image"):
+        img = MIMEImage(fit_image(image_path, budget, mail_options), 'jpeg')
+    img.add_header('Content-ID', f'<{content_id}>')
+    msg.attach(img)
+
 def send_email(mail_options : MailOptions,
                 image_path : str,
                 trigger_image_path : str,
@@ -88,29 +204,30 @@ def send_email(mail_options : MailOptions,
         msg_text = (f'<html><body>{body}<br><br>{seconds} second{"" if seconds == 1 else "s"}'
                     ' after trigger<img src="cid:image1"><br>')
 
+        budget = image_budget(mail_options, 1 if trigger_image_path is None else 2)
+
         # Attach the first image inline
-        with open(image_path, "rb") as attachment:
-            img = MIMEImage(attachment.read())
-            img.add_header('Content-ID', '<image1>')
-            msg.attach(img)
+        attach_image(msg, image_path, 'image1', budget, mail_options)
 
         if trigger_image_path is not None:
             msg_text += 'Trigger image<img src="cid:image2"><br>'
-            with open(trigger_image_path, "rb") as attachment:
-                img = MIMEImage(attachment.read())
-                img.add_header('Content-ID', '<image2>')
-                msg.attach(img)
+            attach_image(msg, trigger_image_path, 'image2', budget, mail_options)
 
         msg_text += '</body></html>'
         msg_alternative.attach(MIMEText(msg_text, 'html'))
 
-        # Connect to the SMTP server and send the email
-        server = smtplib.SMTP(mail_options.smtp_server, mail_options.smtp_port)
-        server.starttls()
-        server.login(mail_options.username, mail_options.password)
-        text = msg.as_string()
-        server.sendmail(mail_options.from_email, mail_options.to_email.split(','), text)
-        server.quit()
+        # Connect to the SMTP server and send the email. send_message flattens
+        # the message straight to bytes, without an extra string copy
+        with span("connect"):
+            server = smtplib.SMTP(mail_options.smtp_server, mail_options.smtp_port)
+        with server:
+            with span("starttls"):
+                server.starttls()
+            with span("login"):
+                server.login(mail_options.username, mail_options.password)
+            with span("send"):
+                server.send_message(msg, mail_options.from_email,
+                                    mail_options.to_email.split(','))
 
         logger.info("Email sent with image: %s", image_path)
 
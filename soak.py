@@ -0,0 +1,223 @@
+#! /usr/bin/env python3
+"""
+Soak test of the detector on a virtual clock, to check scheduling and
+throughput changes in seconds instead of days.
+
+The settings in motion.ini are used, with a simulated camera where a pet
+walks across the scene at random times, and a stand-in for sending email.
+Sleeps jump the clock ahead, and each captured frame moves it on by one
+frame. At the end it reports the events detected, the emails sent, the
+gaps in coverage, and the CPU time per simulated hour.
+
+    python3 soak.py --days 7 --fps 0.2
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import detect_motion
+from clock import SimulationFinished, VirtualClock
+from replay_camera import ReplayCamera
+
+# pylint: disable=I1101
+# Module 'cv2' has no '...' member.
+
+logger = logging.getLogger("detector")
+
+# detection settings in motion.ini are for frames of this size
+CONFIG_SIZE = (640, 480)
+
+
+class Event: # pylint: disable=R0903
+    """ A pet crossing the scene """
+    def __init__(self, start: float, duration: float, left_to_right: bool):
+        self.start = start
+        self.duration = duration
+        self.left_to_right = left_to_right
+        self.detected = False
+
+    @property
+    def end(self) -> float:
+        """ When the pet has left the scene """
+        return self.start + self.duration
+
+
+def schedule_events(start: float, end: float, per_hour: float,
+                    min_seconds: float, max_seconds: float,
+                    rng: random.Random) -> list[Event]:
+    """ Random events, arriving as a Poisson process """
+    events = []
+    now = start
+    while True:
+        now += rng.expovariate(per_hour / 3600)
+        if now >= end:
+            return events
+        event = Event(now, rng.uniform(min_seconds, max_seconds), rng.random() < 0.5)
+        events.append(event)
+        now = event.end
+
+
+class SimulatedCamera:
+    """
+    Camera on a virtual clock. Each capture moves the clock on by one frame
+    and returns a background frame, with the pet drawn on it while an event
+    is happening. Gaps between captures are recorded as coverage gaps.
+    """
+    def __init__(self, clock: VirtualClock, fps: float, # pylint: disable=R0913
+                 events: list[Event], backgrounds: ReplayCamera,
+                 gap_seconds: float):
+        self.clock = clock
+        self.frame_seconds = 1.0 / fps
+        self.events = events
+        self.backgrounds = backgrounds
+        self.gap_seconds = gap_seconds
+        self.next_event = 0
+        self.frames = 0
+        self.last_capture = None
+        self.gaps = []
+
+    def start(self) -> None:
+        """ Start the camera """
+        self.backgrounds.start()
+
+    def stop(self) -> None:
+        """ Stop the camera """
+        self.backgrounds.stop()
+
+    def capture_array(self, name: str = "main"):
+        """ Get the frame at the next frame time """
+        self.clock.advance(self.frame_seconds)
+        now = self.clock.time()
+        if self.last_capture is not None and now - self.last_capture > self.gap_seconds:
+            self.gaps.append((self.last_capture, now))
+        self.last_capture = now
+        self.frames += 1
+
+        frame = self.backgrounds.capture_array(name)
+        while (self.next_event < len(self.events) and
+               self.events[self.next_event].end < now):
+            self.next_event += 1
+        if self.next_event < len(self.events):
+            event = self.events[self.next_event]
+            if event.start <= now:
+                self._draw_pet(frame, event, (now - event.start) / event.duration)
+        return frame
+
+    @staticmethod
+    def _draw_pet(frame, event: Event, progress: float) -> None:
+        height, width = frame.shape[:2]
+        pet_width, pet_height = width // 5, height // 4
+        if not event.left_to_right:
+            progress = 1 - progress
+        x = int(-pet_width + progress * (width + pet_width)) # pylint: disable=C0103
+        y = height // 2 # pylint: disable=C0103
+        cv2.rectangle(frame, (x, y), (x + pet_width, y + pet_height), (40, 40, 40), -1)
+
+
+def background_frames(size: tuple[int, int], frames_dir: str | None) -> ReplayCamera:
+    """ Frames of the empty scene, from a directory or a plain gradient """
+    if frames_dir:
+        camera = ReplayCamera.from_directory(frames_dir)
+        camera.frames = [cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                         for frame in camera.frames]
+        return camera
+    gradient = np.linspace(90, 170, size[0], dtype=np.uint8)
+    frame = np.repeat(np.tile(gradient, (size[1], 1))[:, :, np.newaxis], 3, axis=2)
+    return ReplayCamera([frame])
+
+
+def main(): # pylint: disable=R0914,R0915
+    """ Run the soak test and print the report """
+    parser = argparse.ArgumentParser(description="Soak test the detector on a virtual clock.")
+    parser.add_argument("--days", type=float, default=7, help="Days to simulate.")
+    parser.add_argument("--fps", type=float, default=0.2, help="Simulated frame rate.")
+    parser.add_argument("--size", default="320x240", help="Simulated frame size.")
+    parser.add_argument("--events-per-hour", type=float, default=2,
+                        help="Average pets crossing the scene per hour.")
+    parser.add_argument("--min-event-seconds", type=float, default=20)
+    parser.add_argument("--max-event-seconds", type=float, default=90)
+    parser.add_argument("--frames", help="Directory of background images to replay.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+    parser.add_argument("--verbose", action="store_true", help="Show the detector's log.")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    logger.addHandler(logging.StreamHandler())
+
+    size = tuple(int(value) for value in args.size.split("x"))
+    start = time.mktime((2024, 6, 3, 0, 0, 0, 0, 0, -1))
+    end = start + args.days * 24 * 60 * 60
+    rng = random.Random(args.seed)
+    events = schedule_events(start, end, args.events_per_hour,
+                             args.min_event_seconds, args.max_event_seconds, rng)
+
+    clock = VirtualClock(start, end)
+    camera = SimulatedCamera(clock, args.fps, events, background_frames(size, args.frames),
+                             gap_seconds=max(10 / args.fps, 30))
+
+    camera.start()
+
+    options = detect_motion.MotionOptions.get_motion_options()
+    options.clock = clock
+    options.picam2 = camera
+    options.has_display = False
+    options.image_save_dir = tempfile.mkdtemp(prefix="soak-")
+    options.min_area = options.min_area * size[0] * size[1] // (CONFIG_SIZE[0] * CONFIG_SIZE[1])
+
+    emails = []
+
+    def notify(image_path, trigger_image_path, seconds): # pylint: disable=W0613
+        triggered = clock.time() - seconds
+        emails.append(triggered)
+        for event in events:
+            if event.start <= triggered <= event.end + camera.frame_seconds:
+                event.detected = True
+                return
+        logger.warning("Email at %s with no pet", time.ctime(triggered))
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    try:
+        detect_motion.detect_motion(options, notify)
+    except SimulationFinished:
+        pass
+    cpu_seconds = time.process_time() - cpu_started
+    wall_seconds = time.perf_counter() - wall_started
+
+    for name in os.listdir(options.image_save_dir):
+        os.remove(os.path.join(options.image_save_dir, name))
+    os.rmdir(options.image_save_dir)
+
+    hours = (clock.time() - start) / 3600
+    watched_hours = camera.frames * camera.frame_seconds / 3600
+
+    def in_watch_hours(event):
+        hour = time.localtime(event.start).tm_hour
+        return options.min_hour <= hour < options.max_hour
+
+    watch_hour_events = [event for event in events if in_watch_hours(event)]
+    detected = [event for event in events if event.detected]
+    gap_hours = [(gap_end - gap_start) / 3600 for gap_start, gap_end in camera.gaps]
+    false_emails = len(emails) - len(detected)
+
+    print(f"Simulated {hours / 24:.1f} days in {wall_seconds:.1f}s, "
+          f"{camera.frames} frames at {args.fps} fps, {size[0]}x{size[1]}")
+    print(f"Events  : {len(events)} pets, {len(watch_hour_events)} between "
+          f"{options.min_hour}:00 and {options.max_hour}:00, {len(detected)} detected "
+          f"({len(detected) / max(len(watch_hour_events), 1):.0%} of those)")
+    print(f"Emails  : {len(emails)} sent, {false_emails} with no pet")
+    print(f"Coverage: watching {watched_hours / hours:.0%} of the time, "
+          f"{len(gap_hours)} gaps, longest {max(gap_hours, default=0) * 60:.0f}m, "
+          f"total {sum(gap_hours):.1f}h")
+    print(f"CPU     : {cpu_seconds:.1f}s, {cpu_seconds / hours * 1000:.1f}ms per simulated "
+          f"hour, {cpu_seconds / max(camera.frames, 1) * 1000:.2f}ms per frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Opt-in tracing of where the time goes in each frame, exported as a
+Chrome/Perfetto trace, to see stalls and their causes on a timeline.
+
+Spans are kept in a bounded buffer in memory and written out on SIGUSR1
+and at exit. Open the file in https://ui.perfetto.dev or chrome://tracing.
+
+Usage:
+
+    with span_trace.span("blur"):
+        ...
+
+When tracing is off, span returns a shared object that does nothing.
+"""
+import atexit
+import collections
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+logger = logging.getLogger("detector")
+
+
+class _NoSpan:
+    """ Span used when tracing is off """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    """ Records the time between entering and leaving it """
+    __slots__ = ("owner", "name", "start")
+
+    def __init__(self, owner, name: str):
+        self.owner = owner
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter_ns()
+        self.owner.spans.append((self.name, self.start, end - self.start,
+                                 threading.get_ident()))
+        return False
+
+
+class Tracer:
+    """ Keeps the last spans recorded, and writes them as a trace """
+    def __init__(self):
+        self.enabled = False
+        self.spans = collections.deque()
+        self.path = None
+
+    def configure(self, capacity: int, path: str) -> None:
+        """
+        Turn tracing on.
+
+        Args:
+            capacity: Number of spans kept, the oldest are dropped
+            path: File to write, with time.strftime formatting
+        """
+        self.spans = collections.deque(maxlen=capacity)
+        self.path = path
+        self.enabled = True
+        signal.signal(signal.SIGUSR1, lambda *_: self.dump())
+        atexit.register(self.dump)
+        logger.info("Tracing the last %d spans, kill -USR1 %d to write them",
+                    capacity, os.getpid())
+
+    def span(self, name: str):
+        """ Get a context manager that records a span, if tracing """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def dump(self) -> str | None:
+        """
+        Write the spans recorded as a Chrome trace
+
+        Returns:
+            The path written, None if not tracing
+        """
+        if not self.enabled:
+            return None
+        pid = os.getpid()
+        spans = list(self.spans)
+        threads = {thread.ident: thread.name for thread in threading.enumerate()}
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                   "args": {"name": threads.get(tid, str(tid))}}
+                  for tid in {span[3] for span in spans}]
+        events.extend({"name": name, "cat": "pet_watcher", "ph": "X", "pid": pid, "tid": tid,
+                       "ts": start / 1000, "dur": duration / 1000}
+                      for name, start, duration, tid in spans)
+
+        path = time.strftime(self.path)
+        with open(path, "w", encoding="utf-8") as trace:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace)
+        logger.info("Wrote %d spans to %s", len(spans), path)
+        return path
+
+
+tracer = Tracer()
+
+
+def span(name: str):
+    """ Get a context manager that records a span, if tracing """
+    return tracer.span(name)
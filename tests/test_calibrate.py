@@ -0,0 +1,186 @@
+"""
+Tests of choosing a camera mode, with a fake camera and a fake timer
+"""
+import math
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import calibrate
+from calibrate import ModeResult
+
+
+# Time the fake detection takes on each frame
+DETECT_SECONDS = 0.02
+
+
+class FakeClock: # pylint: disable=R0903
+    """ Timer that only moves when the fake camera captures or detects """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeCamera:
+    """
+    Camera with the Picamera2 calls calibration makes. Like the sensor,
+    it delivers a frame every frame period set for its configuration and
+    sensor size, and a capture only waits if the newest frame was already
+    captured.
+    """
+    def __init__(self, clock: FakeClock, frame_seconds: dict, broken: tuple = ()):
+        """
+        Args:
+            clock: Moved on by each capture that waits for a frame
+            frame_seconds: (configuration, width) to seconds between frames,
+                width None for the still configuration
+            broken: (configuration, width) that fail to configure
+        """
+        self.clock = clock
+        self.frame_seconds = frame_seconds
+        self.broken = broken
+        self.sensor_modes = [{"size": (1332, 990), "bit_depth": 10, "fps": 120.0},
+                             {"size": (2028, 1520), "bit_depth": 12, "fps": 40.0}]
+        self.config = None
+        self.started = None
+        self.captured = 0
+
+    def _create(self, configuration, main, sensor=None, controls=None): # pylint: disable=W0613
+        width = None if sensor is None else sensor["output_size"][0]
+        return {"key": (configuration, width), "main": main}
+
+    def create_still_configuration(self, **kwargs):
+        """ Still configuration """
+        return self._create("still", **kwargs)
+
+    def create_video_configuration(self, **kwargs):
+        """ Video configuration """
+        return self._create("video", **kwargs)
+
+    def create_preview_configuration(self, **kwargs):
+        """ Preview configuration """
+        return self._create("preview", **kwargs)
+
+    def configure(self, config) -> None:
+        """ Use a configuration """
+        if config["key"] in self.broken:
+            raise RuntimeError(f"Can't configure {config['key']}")
+        self.config = config
+
+    def start(self) -> None:
+        """ Start the camera, with the first frame one frame period later """
+        self.started = self.clock.now
+        self.captured = 0
+
+    def stop(self) -> None:
+        """ Stop the camera """
+        self.started = None
+
+    def capture_array(self):
+        """ Capture the newest frame, waiting for the next one if it was captured """
+        assert self.started is not None
+        period = self.frame_seconds[self.config["key"]]
+        # small tolerance, so float error doesn't make a frame late
+        newest = math.floor((self.clock.now - self.started) / period + 1e-9)
+        if newest > self.captured:
+            self.captured = newest
+        else:
+            self.captured += 1
+            self.clock.now = self.started + self.captured * period
+        width, height = self.config["main"]["size"]
+        return np.zeros((height // 8, width // 8, 3), np.uint8)
+
+
+class ChooseModeTest(unittest.TestCase):
+    """ Tests of choose_mode """
+    def test_highest_effective_fps(self):
+        """ The loop rate counts both the wait for a frame and detection """
+        fast_capture = ModeResult({"configuration": "video"}, 0.01, 0.1)
+        balanced = ModeResult({"configuration": "preview"}, 0.05, 0.02)
+        self.assertAlmostEqual(balanced.effective_fps, 1 / 0.07)
+        self.assertIs(calibrate.choose_mode([fast_capture, balanced]), balanced)
+
+    def test_cheaper_detection_breaks_ties(self):
+        """ Of modes with the same rate, the one with cheaper detection wins """
+        costly = ModeResult({"configuration": "video"}, 0.05, 0.05)
+        cheap = ModeResult({"configuration": "preview"}, 0.09, 0.01)
+        self.assertIs(calibrate.choose_mode([costly, cheap]), cheap)
+
+    def test_none_usable(self):
+        """ Modes under min_fps aren't chosen """
+        slow = ModeResult({"configuration": "still"}, 1.5, 0.01)
+        self.assertIsNone(calibrate.choose_mode([slow], min_fps=1.0))
+
+
+class CalibrateTest(unittest.TestCase):
+    """ Tests of calibrate """
+    def setUp(self):
+        self.clock = FakeClock()
+        self.frame_seconds = {("still", None): 0.5,
+                              ("video", 1332): 0.05, ("preview", 1332): 0.125,
+                              ("video", 2028): 0.1, ("preview", 2028): 0.2}
+        patcher = mock.patch.object(calibrate, "detect_cost", self.detect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def detect(self, prev_gray, frame): # pylint: disable=W0613
+        """ Fake detection, taking DETECT_SECONDS """
+        self.clock.now += DETECT_SECONDS
+        return frame
+
+    def test_detection_overlaps_frame_wait(self):
+        """
+        Frames arrive while motion is detected, so a mode capped at 30fps
+        loops at 30fps, and doesn't tie with a faster mode
+        """
+        camera = FakeCamera(self.clock, {("video", 1332): 1 / 60, ("preview", 1332): 1 / 30})
+        capped = calibrate.measure(camera, {"configuration": "preview", "fps": 30.0,
+                                            "sensor": {"output_size": [1332, 990],
+                                                       "bit_depth": 10}},
+                                   timer=self.clock)
+        faster = calibrate.measure(camera, {"configuration": "video", "fps": 60.0,
+                                            "sensor": {"output_size": [1332, 990],
+                                                       "bit_depth": 10}},
+                                  timer=self.clock)
+        self.assertAlmostEqual(capped.effective_fps, 30, delta=1)
+        self.assertAlmostEqual(faster.effective_fps, 1 / DETECT_SECONDS, delta=2)
+        self.assertIs(calibrate.choose_mode([capped, faster]), faster)
+
+    def test_fastest_mode_chosen(self):
+        """ The mode with the fastest captures is chosen """
+        camera = FakeCamera(self.clock, self.frame_seconds)
+        mode = calibrate.calibrate(camera, frames=3, timer=self.clock)
+        self.assertEqual(mode["configuration"], "video")
+        self.assertEqual(mode["sensor"], {"output_size": [1332, 990], "bit_depth": 10})
+        self.assertEqual(mode["fps"], 120.0)
+        self.assertIsNone(camera.started)
+
+    def test_broken_mode_skipped(self):
+        """ A mode that fails to configure is skipped """
+        camera = FakeCamera(self.clock, self.frame_seconds, broken=(("video", 1332),))
+        mode = calibrate.calibrate(camera, frames=3, timer=self.clock)
+        self.assertEqual((mode["configuration"], mode["sensor"]["output_size"][0]),
+                         ("video", 2028))
+
+    def test_too_slow(self):
+        """ None when no mode reaches min_fps """
+        camera = FakeCamera(self.clock, self.frame_seconds)
+        self.assertIsNone(calibrate.calibrate(camera, frames=3, min_fps=30, timer=self.clock))
+
+    def test_saved_mode_is_per_camera_model(self):
+        """ A saved mode is only loaded for the camera model it was saved for """
+        mode = {"configuration": "video", "sensor": None, "fps": None}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "camera_mode.json")
+            calibrate.save_mode(path, "imx500", mode)
+            self.assertEqual(calibrate.load_mode(path, "imx500"), mode)
+            self.assertIsNone(calibrate.load_mode(path, "imx708"))
+
+
+if __name__ == "__main__":
+    unittest.main()
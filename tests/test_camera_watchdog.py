@@ -0,0 +1,87 @@
+"""
+Tests of the capture watchdog, with stalls injected by ReplayCamera
+"""
+import time
+import unittest
+
+import numpy as np
+
+from camera_watchdog import CaptureWatchdog
+from replay_camera import ReplayCamera
+
+
+def numbered_frames(count: int) -> list:
+    """ Frames filled with their frame number """
+    return [np.full((4, 4, 3), number, np.uint8) for number in range(count)]
+
+
+class CaptureWatchdogTest(unittest.TestCase):
+    """ Tests of CaptureWatchdog """
+    def setUp(self):
+        self.camera = ReplayCamera(numbered_frames(10), stalls={2: None})
+
+        def open_camera():
+            self.camera.start()
+            return self.camera
+
+        self.watchdog = CaptureWatchdog(open_camera, timeout_seconds=0.2,
+                                        backoff_seconds=0.01)
+
+    def tearDown(self):
+        self.watchdog.stop()
+
+    def test_capture_resumes_after_stall(self):
+        """ A hung capture restarts the camera and capturing carries on """
+        self.assertEqual(self.watchdog.capture_array()[0, 0, 0], 0)
+        self.assertEqual(self.watchdog.capture_array()[0, 0, 0], 1)
+        # frame 2 hangs until the camera is stopped, so the next one is returned
+        self.assertEqual(self.watchdog.capture_array()[0, 0, 0], 3)
+        self.assertEqual(self.watchdog.capture_array()[0, 0, 0], 4)
+
+        stats = self.watchdog.stats()
+        self.assertEqual(stats["stalls"], 1)
+        self.assertEqual(stats["restarts"], 1)
+
+    def test_recovery_counts_from_stalled_call(self):
+        """ The time to recover includes waiting for the stalled capture """
+        for _ in range(4):
+            self.watchdog.capture_array()
+        self.assertGreaterEqual(self.watchdog.last_recovery_seconds, 0.2)
+
+
+class StalledOpenTest(unittest.TestCase):
+    """ Tests of a camera restart where opening the camera stalls """
+    def setUp(self):
+        self.cameras = []
+
+        def open_camera():
+            camera = ReplayCamera(numbered_frames(10), stalls={1: None})
+            camera.start()
+            self.cameras.append(camera)
+            if len(self.cameras) == 2:
+                # opens after the deadline, so the watchdog has given up on it
+                time.sleep(0.4)
+            return camera
+
+        self.watchdog = CaptureWatchdog(open_camera, timeout_seconds=0.2,
+                                        backoff_seconds=0.01)
+
+    def tearDown(self):
+        self.watchdog.stop()
+
+    def test_late_camera_closed(self):
+        """ A camera that opens too late is closed, and the next one is used """
+        self.watchdog.capture_array()
+        # the capture stalls, and the first reopen stalls
+        self.assertEqual(self.watchdog.capture_array()[0, 0, 0], 0)
+        self.assertIs(self.watchdog.camera, self.cameras[2])
+        self.assertEqual(self.watchdog.stats()["restarts"], 1)
+
+        # the late camera is closed once its open finishes
+        time.sleep(0.4)
+        self.assertFalse(self.cameras[1].started)
+        self.assertTrue(self.cameras[2].started)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+Tests of sharing frames through shared memory, in one process
+"""
+import os
+import unittest
+
+import numpy as np
+
+from frame_bus import FramePublisher, FrameSubscriber
+
+
+class FrameBusTest(unittest.TestCase):
+    """ Tests of FramePublisher and FrameSubscriber """
+    def setUp(self):
+        self.publisher = FramePublisher(f"frame_bus_test_{os.getpid()}", slots=2)
+        self.addCleanup(self.publisher.close)
+
+    def subscribe(self) -> FrameSubscriber:
+        """ Subscribe to the publisher """
+        subscriber = FrameSubscriber(self.publisher.name)
+        self.addCleanup(subscriber.close)
+        return subscriber
+
+    def test_latest_and_overwritten(self):
+        """ The newest frame is seen, and overwritten slots are invalid """
+        self.publisher.publish(np.full((4, 6, 3), 1, np.uint8))
+        subscriber = self.subscribe()
+        sequence, frame = subscriber.latest()
+        self.assertEqual(sequence, 1)
+        self.assertTrue((frame == 1).all())
+
+        self.publisher.publish(np.full((4, 6, 3), 2, np.uint8))
+        self.publisher.publish(np.full((4, 6, 3), 3, np.uint8))
+        self.assertFalse(subscriber.valid(1))
+        self.assertTrue((subscriber.copy(3) == 3).all())
+
+    def test_new_frame_size(self):
+        """ A subscriber follows the publisher to a ring for a new frame size """
+        self.publisher.publish(np.zeros((4, 6, 3), np.uint8))
+        self.publisher.publish(np.zeros((4, 6, 3), np.uint8))
+        subscriber = self.subscribe()
+        last, _ = subscriber.latest()
+        self.assertEqual(last, 2)
+
+        self.publisher.publish(np.full((8, 12), 7, np.uint8))
+        sequence, frame = subscriber.next(last, timeout=0)
+        self.assertEqual(sequence, 1)
+        self.assertEqual(frame.shape, (8, 12, 1))
+        self.assertTrue((frame == 7).all())
+        self.assertEqual(subscriber.generation, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
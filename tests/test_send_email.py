@@ -0,0 +1,90 @@
+"""
+Tests of fitting email images into the message size budget
+"""
+import configparser
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+import send_email
+
+# pylint: disable=I1101
+# Module 'cv2' has no '...' member.
+
+
+def mail_options(**settings) -> send_email.MailOptions:
+    """ MailOptions with the required fields and the given settings """
+    config = configparser.ConfigParser()
+    config.read_dict({"email": {"username": "user", "password": "secret", "to": "to@example.com",
+                                **{key: str(value) for key, value in settings.items()}}})
+    return send_email.MailOptions(config["email"])
+
+
+def jpeg_size(image, quality: int) -> int:
+    """ Size of the image as a JPEG at a quality """
+    _, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return len(jpeg)
+
+
+class ImageBudgetTest(unittest.TestCase):
+    """ Tests of image_budget """
+    def test_no_budget(self):
+        """ 0 when max_message_bytes isn't set """
+        self.assertEqual(send_email.image_budget(mail_options(), 2), 0)
+
+    def test_split_between_images(self):
+        """ What is left after the overhead and base64 is split between the images """
+        options = mail_options(max_message_bytes=1_000_000)
+        budget = send_email.image_budget(options, 2)
+        self.assertEqual(budget, (1_000_000 - send_email.MESSAGE_OVERHEAD_BYTES) * 57 // 78 // 2)
+        # two images base64 encoded, with line breaks, still fit
+        encoded = 2 * ((budget + 56) // 57 * 78)
+        self.assertLessEqual(encoded + send_email.MESSAGE_OVERHEAD_BYTES, 1_000_000)
+
+
+class FitImageTest(unittest.TestCase):
+    """ Tests of fit_image """
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        gradient = np.linspace(0, 255, 640, dtype=np.float32)
+        noise = rng.normal(0, 20, (480, 640, 3))
+        self.image = np.clip(gradient[np.newaxis, :, np.newaxis] + noise, 0, 255).astype(np.uint8)
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=R1732
+        self.path = os.path.join(self.directory.name, "image.jpg")
+        cv2.imwrite(self.path, self.image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        self.options = mail_options(jpeg_quality=90, min_jpeg_quality=40)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fit(self, budget: int):
+        """ Fit the image, returning the JPEG and its decoded image """
+        jpeg = send_email.fit_image(self.path, budget, self.options)
+        return jpeg, cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+
+    def test_file_that_fits_is_unchanged(self):
+        """ A file already under the budget is sent as it is """
+        jpeg, _ = self.fit(os.path.getsize(self.path))
+        with open(self.path, "rb") as file:
+            self.assertEqual(jpeg, file.read())
+
+    def test_lower_quality_before_scaling(self):
+        """ If the lowest quality fits, the image keeps its size """
+        budget = (jpeg_size(self.image, 40) + jpeg_size(self.image, 90)) // 2
+        jpeg, image = self.fit(budget)
+        self.assertLessEqual(len(jpeg), budget)
+        self.assertEqual(image.shape, self.image.shape)
+
+    def test_scaled_when_lowest_quality_too_big(self):
+        """ If the lowest quality doesn't fit, the image is scaled down """
+        budget = jpeg_size(self.image, 40) * 2 // 3
+        jpeg, image = self.fit(budget)
+        self.assertLessEqual(len(jpeg), budget)
+        self.assertLess(image.shape[1], self.image.shape[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
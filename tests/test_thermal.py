@@ -0,0 +1,59 @@
+"""
+Tests of the thermal governor, reading fake sysfs and procfs files
+"""
+import os
+import tempfile
+import unittest
+
+import thermal
+
+
+class ThermalGovernorTest(unittest.TestCase):
+    """ Tests of ThermalGovernor """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=R1732
+        self.temp_path = os.path.join(self.directory.name, "temp")
+        self.load_path = os.path.join(self.directory.name, "loadavg")
+        self.governor = thermal.ThermalGovernor(self.temp_path, self.load_path,
+                                                warm_temp=70, hot_temp=78, hysteresis=5,
+                                                max_load=4, check_seconds=0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check(self, temperature: float, load: float = 0.5) -> thermal.Level:
+        """ Write the files, then check """
+        with open(self.temp_path, "w", encoding="ascii") as file:
+            file.write(f"{int(temperature * 1000)}\n")
+        with open(self.load_path, "w", encoding="ascii") as file:
+            file.write(f"{load} 0.40 0.30 1/123 4567\n")
+        return self.governor.check()
+
+    def test_steps_down_and_back_up_with_hysteresis(self):
+        """ Steps down at each limit, and back up only once under it by the hysteresis """
+        self.assertIs(self.check(50), thermal.FULL)
+        self.assertIs(self.check(72), thermal.WARM)
+        self.assertIs(self.check(80), thermal.HOT)
+        # under the hot limit, but not by the hysteresis
+        self.assertIs(self.check(75), thermal.HOT)
+        self.assertIs(self.check(72), thermal.WARM)
+        self.assertIs(self.check(66), thermal.WARM)
+        self.assertIs(self.check(64), thermal.FULL)
+        self.assertEqual(self.governor.changes, 4)
+        self.assertEqual(self.governor.stats()["temperature"], 64)
+
+    def test_load_steps_down(self):
+        """ A busy CPU steps down to WARM, and back once the load is under 80% of the limit """
+        self.assertIs(self.check(50, load=4.0), thermal.WARM)
+        self.assertIs(self.check(50, load=3.5), thermal.WARM)
+        self.assertIs(self.check(50, load=3.0), thermal.FULL)
+
+    def test_missing_files(self):
+        """ Without the files, detection runs at full speed """
+        self.assertIs(self.governor.check(), thermal.FULL)
+        self.assertIsNone(self.governor.temperature)
+        self.assertIsNone(self.governor.load)
+
+
+if __name__ == "__main__":
+    unittest.main()
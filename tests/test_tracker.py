@@ -0,0 +1,90 @@
+"""
+Tests of tracking motion boxes, and of classifying the tracks confirmed
+"""
+import configparser
+import unittest
+
+import numpy as np
+
+import detect_motion
+from clock import VirtualClock
+from tracker import Tracker
+
+
+class CountingClassifier: # pylint: disable=R0903
+    """ Stand-in for PetClassifier that counts calls """
+    def __init__(self, animal: bool):
+        self.animal = animal
+        self.calls = 0
+
+    def is_animal(self, frame, boxes) -> bool: # pylint: disable=W0613
+        """ Count the call, and give the set answer """
+        self.calls += 1
+        return self.animal
+
+
+class TrackerTest(unittest.TestCase):
+    """ Tests of Tracker """
+    def test_fires_once(self):
+        """ A box moving across frames is one track, returned once it is confirmed """
+        tracker = Tracker(confirm_frames=3)
+        returned = []
+        for frame in range(10):
+            confirmed = tracker.update([(frame * 10, 100, 50, 50)], frame)
+            for track in confirmed:
+                track.fired = True
+                returned.append((track.hits, track.distance))
+        self.assertEqual(returned, [(3, 20)])
+
+    def test_path_is_bounded(self):
+        """ A long lived track only keeps its recent path """
+        tracker = Tracker()
+        for frame in range(1000):
+            tracker.update([(frame % 50, 100, 50, 50)], frame)
+        self.assertEqual(len(tracker.tracks), 1)
+        self.assertLessEqual(len(tracker.tracks[0].path), 100)
+
+
+class ConfirmMotionTest(unittest.TestCase):
+    """ Tests of classifying confirmed tracks in the frame loop """
+    def setUp(self):
+        config = configparser.ConfigParser()
+        config.read_dict({"motion": {"classifier_cache_seconds": "10"}})
+        self.options = detect_motion.MotionOptions(config["motion"])
+        self.options.clock = VirtualClock(0)
+        self.frame = np.zeros((480, 640, 3), np.uint8)
+
+    def run_frames(self, frames: int, fps: float = 10) -> list:
+        """ Move a box across frames, returning the tracks that fire """
+        tracker = detect_motion.new_tracker(self.options)
+        fired = []
+        for frame in range(frames):
+            self.options.clock.advance(1 / fps)
+            confirmed = detect_motion.confirm_motion(self.options, tracker, self.frame,
+                                                     [(frame * 10, 100, 50, 50)])
+            for track in confirmed:
+                track.fired = True
+            fired.extend(confirmed)
+        return fired
+
+    def test_rejected_track_not_reclassified_every_frame(self):
+        """ A track that isn't an animal is only classified again after the cache time """
+        self.options.classifier = CountingClassifier(animal=False)
+        # 50 frames over 5 seconds
+        self.assertEqual(self.run_frames(50), [])
+        self.assertEqual(self.options.classifier.calls, 1)
+
+        # 150 frames over 15 seconds, rechecked once after 10 seconds
+        self.options.classifier = CountingClassifier(animal=False)
+        self.run_frames(150)
+        self.assertEqual(self.options.classifier.calls, 2)
+
+    def test_animal_fires_once(self):
+        """ A track that is an animal is classified once and fires """
+        self.options.classifier = CountingClassifier(animal=True)
+        self.assertEqual(len(self.run_frames(50)), 1)
+        self.assertEqual(self.options.classifier.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
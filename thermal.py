@@ -0,0 +1,126 @@
+"""
+Steps the detection workload down when the Pi gets hot or busy, and back up
+when it cools, so the frame rate drops in planned steps instead of
+collapsing when the firmware throttles the CPU.
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger("detector")
+
+
+class Level: # pylint: disable=R0903
+    """ How much work detection does at one step """
+    def __init__(self, name: str, frame_interval_seconds: float, scale: int, display: bool):
+        """
+        Args:
+            name: Name for logging
+            frame_interval_seconds: Sleep between frames
+            scale: Frames are shrunk by this before detecting motion
+            display: If the preview server and imshow windows are updated
+        """
+        self.name = name
+        self.frame_interval_seconds = frame_interval_seconds
+        self.scale = scale
+        self.display = display
+
+    def __repr__(self):
+        return self.name
+
+
+FULL = Level("full", 0.0, 1, True)
+WARM = Level("warm", 0.1, 2, False)
+HOT = Level("hot", 0.5, 4, False)
+LEVELS = (FULL, WARM, HOT)
+
+
+def read_number(path: str, field: int = 0) -> float | None:
+    """ Read a whitespace separated number from a sysfs or procfs file, None if it can't be """
+    try:
+        with open(path, encoding="ascii") as file:
+            return float(file.read().split()[field])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ThermalGovernor: # pylint: disable=R0902
+    """
+    Reads the SoC temperature and load average and picks a Level. It steps
+    down as soon as a limit is passed, and back up only once the temperature
+    is hysteresis degrees under the limit and the load is under 80% of its
+    limit.
+    """
+    def __init__(self, # pylint: disable=R0913
+                 temp_path: str = "/sys/class/thermal/thermal_zone0/temp",
+                 load_path: str = "/proc/loadavg",
+                 warm_temp: float = 70.0,
+                 hot_temp: float = 78.0,
+                 hysteresis: float = 5.0,
+                 max_load: float = 0.0,
+                 check_seconds: float = 10.0):
+        """
+        Args:
+            temp_path: File with the temperature in millidegrees C
+            load_path: File with the load averages, the first is used
+            warm_temp: Temperature to step down to WARM
+            hot_temp: Temperature to step down to HOT
+            hysteresis: Degrees under a limit needed to step back up
+            max_load: Load average to step down to WARM, 0 for the number of CPUs
+            check_seconds: How often the files are read
+        """
+        self.temp_path = temp_path
+        self.load_path = load_path
+        self.warm_temp = warm_temp
+        self.hot_temp = hot_temp
+        self.hysteresis = hysteresis
+        self.max_load = max_load or float(os.cpu_count() or 1)
+        self.check_seconds = check_seconds
+
+        self.level = FULL
+        self.temperature = None
+        self.load = None
+        self.changes = 0
+        self.last_check = -check_seconds
+
+    def check(self) -> Level:
+        """ Get the level to run at, reading the files if the interval has passed """
+        now = time.monotonic()
+        if now - self.last_check < self.check_seconds:
+            return self.level
+        self.last_check = now
+
+        millidegrees = read_number(self.temp_path)
+        self.temperature = None if millidegrees is None else millidegrees / 1000
+        self.load = read_number(self.load_path)
+
+        level = self._level_for(0.0, 1.0)
+        if LEVELS.index(level) < LEVELS.index(self.level):
+            # only step back up once comfortably under the limits
+            level = max(level, self._level_for(self.hysteresis, 0.8), key=LEVELS.index)
+
+        if level is not self.level:
+            self.changes += 1
+            log = logger.warning if LEVELS.index(level) > LEVELS.index(self.level) else logger.info
+            log("Detection %s -> %s at %s C, load %s", self.level, level,
+                self.temperature, self.load)
+            self.level = level
+        return self.level
+
+    def stats(self) -> dict:
+        """ Get the governor metrics """
+        return {
+            "level": self.level.name,
+            "temperature": self.temperature,
+            "load": self.load,
+            "changes": self.changes,
+        }
+
+    def _level_for(self, hysteresis: float, load_fraction: float) -> Level:
+        temperature = self.temperature
+        if temperature is not None and temperature >= self.hot_temp - hysteresis:
+            return HOT
+        if ((temperature is not None and temperature >= self.warm_temp - hysteresis) or
+                (self.load is not None and self.load >= self.max_load * load_fraction)):
+            return WARM
+        return FULL
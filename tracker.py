@@ -0,0 +1,167 @@
+"""
+Tracks the boxes of motion across frames, so one moving object is one event.
+"""
+import collections
+import itertools
+import math
+
+# Centers kept per track, so a track that lives for hours stays small
+PATH_LENGTH = 100
+
+
+def iou(box_a, box_b) -> float:
+    """ Intersection over union of two (x, y, w, h) boxes """
+    ax, ay, aw, ah = box_a # pylint: disable=C0103
+    bx, by, bw, bh = box_b # pylint: disable=C0103
+    width = min(ax + aw, bx + bw) - max(ax, bx)
+    height = min(ay + ah, by + bh) - max(ay, by)
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (aw * ah + bw * bh - intersection)
+
+
+def centroid(box) -> tuple[float, float]:
+    """ Center of an (x, y, w, h) box """
+    x, y, w, h = box # pylint: disable=C0103
+    return (x + w / 2, y + h / 2)
+
+
+def merge_boxes(boxes: list, distance: int) -> list:
+    """
+    Merge boxes that overlap or are within distance pixels of each other,
+    since contours of one object are often in pieces.
+    """
+    boxes = list(boxes)
+    merged = True
+    while merged and len(boxes) > 1:
+        merged = False
+        for i, j in itertools.combinations(range(len(boxes)), 2):
+            ax, ay, aw, ah = boxes[i] # pylint: disable=C0103
+            bx, by, bw, bh = boxes[j] # pylint: disable=C0103
+            if (ax - distance <= bx + bw and bx - distance <= ax + aw and
+                    ay - distance <= by + bh and by - distance <= ay + ah):
+                x, y = min(ax, bx), min(ay, by) # pylint: disable=C0103
+                boxes[i] = (x, y, max(ax + aw, bx + bw) - x, max(ay + ah, by + bh) - y)
+                del boxes[j]
+                merged = True
+                break
+    return boxes
+
+
+class Track: # pylint: disable=R0902,R0903
+    """
+    One object being followed across frames. Only the last PATH_LENGTH
+    centers are kept, distance is the whole way the center has moved.
+    """
+    def __init__(self, track_id: int, box, now: float):
+        self.track_id = track_id
+        self.box = box
+        self.path = collections.deque([centroid(box)], maxlen=PATH_LENGTH)
+        self.distance = 0.0
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.missed = 0
+        self.fired = False
+        # when the classifier said it isn't an animal
+        self.rejected_at = None
+
+    @property
+    def duration(self) -> float:
+        """ Seconds the track has been seen for """
+        return self.last_seen - self.first_seen
+
+    def update(self, box, now: float) -> None:
+        """ Add the track's box in a new frame """
+        center = centroid(box)
+        self.distance += math.dist(self.path[-1], center)
+        self.box = box
+        self.path.append(center)
+        self.last_seen = now
+        self.hits += 1
+        self.missed = 0
+
+
+class Tracker: # pylint: disable=R0902,R0903
+    """
+    Centroid and IoU tracker. Each frame's boxes are matched to the existing
+    tracks, by overlap then by distance between centers. A track is
+    confirmed once it is seen in confirm_frames frames, and dropped once it
+    isn't seen for max_missed frames. A track rejected by the classifier
+    isn't returned again until recheck_seconds have passed.
+    """
+    def __init__(self, confirm_frames: int = 2, # pylint: disable=R0913
+                 max_missed: int = 5,
+                 min_iou: float = 0.3,
+                 max_distance: float = 80.0,
+                 merge_distance: int = 20,
+                 recheck_seconds: float = 10.0):
+        """
+        Args:
+            confirm_frames: Frames a track must be seen in to be confirmed
+            max_missed: Frames a track can be missing before it is dropped
+            min_iou: Overlap needed to match a box to a track
+            max_distance: Distance between centers to match a box to a track
+                that doesn't overlap it enough
+            merge_distance: Boxes this close together in a frame are merged
+            recheck_seconds: How long a rejected track is left before it is
+                returned to be classified again
+        """
+        self.confirm_frames = confirm_frames
+        self.max_missed = max_missed
+        self.min_iou = min_iou
+        self.max_distance = max_distance
+        self.merge_distance = merge_distance
+        self.recheck_seconds = recheck_seconds
+        self.tracks: list[Track] = []
+        self.next_id = 1
+
+    def update(self, boxes: list, now: float) -> list[Track]:
+        """
+        Update the tracks with a frame's boxes.
+
+        Returns:
+            Confirmed tracks that haven't fired yet. Set fired on the ones
+            acted on so they aren't returned again, or rejected_at on the
+            ones rejected so they aren't returned until recheck_seconds pass.
+        """
+        boxes = merge_boxes(boxes, self.merge_distance)
+        unmatched_tracks = list(self.tracks)
+        unmatched_boxes = list(boxes)
+
+        # best overlaps first, then closest centers
+        pairs = sorted(((iou(track.box, box), track, box)
+                        for track in unmatched_tracks for box in unmatched_boxes),
+                       key=lambda pair: pair[0], reverse=True)
+        for overlap, track, box in pairs:
+            if overlap < self.min_iou:
+                break
+            if track in unmatched_tracks and box in unmatched_boxes:
+                track.update(box, now)
+                unmatched_tracks.remove(track)
+                unmatched_boxes.remove(box)
+
+        pairs = sorted(((math.dist(centroid(track.box), centroid(box)), track, box)
+                        for track in unmatched_tracks for box in unmatched_boxes),
+                       key=lambda pair: pair[0])
+        for distance, track, box in pairs:
+            if distance > self.max_distance:
+                break
+            if track in unmatched_tracks and box in unmatched_boxes:
+                track.update(box, now)
+                unmatched_tracks.remove(track)
+                unmatched_boxes.remove(box)
+
+        for track in unmatched_tracks:
+            track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for box in unmatched_boxes:
+            self.tracks.append(Track(self.next_id, box, now))
+            self.next_id += 1
+
+        return [track for track in self.tracks
+                if track.hits >= self.confirm_frames and not track.fired and track.missed == 0
+                and (track.rejected_at is None or
+                     now - track.rejected_at >= self.recheck_seconds)]